@@ -0,0 +1,232 @@
+import os
+import time
+import math
+import sqlite3
+import threading
+import logging
+
+from limits.storage import Storage
+
+from sqlite_db import connect, sqlite_path
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """Raised when the agent call budget is exhausted; carries the suggested retry delay"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Agent capacity exhausted, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+class SQLiteStorage(Storage):
+    """
+    flask-limiter storage backed by a local SQLite file.
+
+    Lets every gunicorn worker on one host share the same counters without a
+    Redis server: ``RATELIMIT_STORAGE_URI=sqlite:////var/lib/mqa-chatbot/limits.db``.
+    Supports the default fixed-window strategy.
+    """
+
+    STORAGE_SCHEME = ['sqlite']
+
+    def __init__(self, uri, wrap_exceptions=False, **options):
+        super().__init__(uri, wrap_exceptions=wrap_exceptions, **options)
+        self.path = sqlite_path(uri)
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS rate_limits '
+            '(key TEXT PRIMARY KEY, value INTEGER NOT NULL, expires_at REAL NOT NULL)'
+        )
+
+    @property
+    def base_exceptions(self):
+        return sqlite3.Error
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path)
+        return connection
+
+    def incr(self, key, expiry, amount=1):
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM rate_limits WHERE key = ? AND expires_at <= ?', (key, now))
+            connection.execute(
+                'INSERT INTO rate_limits (key, value, expires_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = value + excluded.value',
+                (key, amount, now + expiry)
+            )
+            value = connection.execute('SELECT value FROM rate_limits WHERE key = ?', (key,)).fetchone()[0]
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return value
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM rate_limits WHERE key = ? AND expires_at > ?', (key, time.time())
+        ).fetchone()
+        return row[0] if row else 0
+
+    def get_expiry(self, key):
+        row = self._connection().execute(
+            'SELECT expires_at FROM rate_limits WHERE key = ?', (key,)
+        ).fetchone()
+        return row[0] if row else time.time()
+
+    def check(self):
+        try:
+            self._connection().execute('SELECT 1')
+            return True
+        except sqlite3.Error:
+            return False
+
+    def reset(self):
+        cursor = self._connection().execute('DELETE FROM rate_limits')
+        return cursor.rowcount
+
+    def clear(self, key):
+        self._connection().execute('DELETE FROM rate_limits WHERE key = ?', (key,))
+
+
+class MemoryTokenBucket:
+    """Token bucket for a single process"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """Take one token, returning 0 on success or the seconds until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+class SQLiteTokenBucket:
+    """Token bucket shared by every process that opens the same SQLite file"""
+
+    def __init__(self, path, rate, capacity, name='dialogflow'):
+        self.path = path
+        self.rate = rate
+        self.capacity = capacity
+        self.name = name
+        self._local = threading.local()
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS token_buckets '
+            '(name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path)
+        return connection
+
+    def take(self):
+        """Take one token, returning 0 on success or the seconds until one is available"""
+        now = time.time()
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT tokens, updated_at FROM token_buckets WHERE name = ?', (self.name,)
+            ).fetchone()
+            tokens = self.capacity if row is None else min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / self.rate
+
+            connection.execute(
+                'INSERT INTO token_buckets (name, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (self.name, tokens, now)
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return wait
+
+
+class AdmissionController:
+    """
+    Global budget for upstream agent calls.
+
+    Each call takes a token from a bucket refilled at ``rate`` per second up to
+    ``burst``. A caller that would have to wait up to ``max_wait`` seconds is
+    queued by sleeping; beyond that it is shed with AdmissionRejected so the
+    client gets a fast 429 instead of piling onto a saturated agent.
+    """
+
+    def __init__(self, bucket, max_wait=2.0):
+        self.bucket = bucket
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build the controller from environment variables, or None when disabled"""
+        rate = float(os.getenv('ADMISSION_RATE_PER_SECOND', '0'))
+        if rate <= 0:
+            return None
+
+        capacity = float(os.getenv('ADMISSION_BURST', str(max(1.0, rate))))
+        storage = os.getenv('ADMISSION_STORAGE_URI', 'memory://')
+        if storage.startswith('sqlite://'):
+            bucket = SQLiteTokenBucket(sqlite_path(storage), rate, capacity)
+        else:
+            bucket = MemoryTokenBucket(rate, capacity)
+
+        logger.info(f"Agent admission control enabled: {rate}/s, burst {capacity}, storage {storage}")
+        return cls(bucket, max_wait=float(os.getenv('ADMISSION_MAX_WAIT_SECONDS', '2')))
+
+    def acquire(self, max_wait=None):
+        """Block until the call is admitted, or raise AdmissionRejected"""
+        max_wait = self.max_wait if max_wait is None else min(self.max_wait, max_wait)
+        waited = 0.0
+        while True:
+            wait = self.bucket.take()
+            if wait == 0:
+                with self._lock:
+                    self.admitted += 1
+                    if waited:
+                        self.queued += 1
+                return
+
+            if waited + wait > max_wait:
+                with self._lock:
+                    self.rejected += 1
+                raise AdmissionRejected(max(1, math.ceil(wait)))
+
+            time.sleep(wait)
+            waited += wait
+
+    def stats(self):
+        with self._lock:
+            return {
+                'admitted': self.admitted,
+                'queued': self.queued,
+                'rejected': self.rejected,
+            }
@@ -1,12 +1,26 @@
-from flask import Flask, render_template, request, jsonify, session
+from flask import Flask, render_template, request, jsonify, session, Response, stream_with_context, g
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from chat import ChatBot
+from backends import create_backend
+from bootstrap import BackgroundInitializer
+from admission import AdmissionRejected  # also registers the sqlite:// rate limit storage
+from faq_index import FaqIndex
+from metrics import REGISTRY, REQUEST_LATENCY, STAGE_LATENCY, RATE_LIMITED
+from logging_config import configure_logging, payload_logging_enabled
+from batch import BatchError, parse_batch, run_batch
+from conversations import ROLES, create_conversation_store
 import os
+import hmac
 import logging
 import json
+import math
 from datetime import datetime
 import uuid
+import time
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -17,10 +31,7 @@ app = Flask(__name__)
 app.secret_key = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
 
 # Setup logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+configure_logging()
 
 def resolve_credentials_path(credentials_path):
     """Resolve relative paths to absolute paths"""
@@ -53,6 +64,25 @@ def resolve_credentials_path(credentials_path):
     
     return credentials_path
 
+# Request timing
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    if 'request_start' in g:
+        # For streamed responses this is the time to the first byte
+        REQUEST_LATENCY.observe(
+            time.perf_counter() - g.request_start,
+            endpoint=endpoint,
+            status=str(response.status_code)
+        )
+    if response.status_code == 429:
+        RATE_LIMITED.inc(endpoint=endpoint)
+    return response
+
 # Session management
 @app.before_request
 def make_session_permanent():
@@ -61,15 +91,53 @@ def make_session_permanent():
         session['session_id'] = str(uuid.uuid4())
 
 # Initialize rate limiting
+# Use a shared storage (sqlite:///... on one host, redis://... across hosts) so the
+# limits hold across gunicorn workers instead of being multiplied by their count
 limiter = Limiter(
     app=app,
     key_func=get_remote_address,
-    default_limits=["200 per day", "50 per hour"]
+    default_limits=["200 per day", "50 per hour"],
+    storage_uri=os.getenv('RATELIMIT_STORAGE_URI', 'memory://'),
+    enabled=os.getenv('RATELIMIT_ENABLED', 'true').lower() == 'true'
 )
 
+@app.errorhandler(429)
+def rate_limit_exceeded(e):
+    """JSON body for rate-limited requests so the chat UI can show why"""
+    current = limiter.current_limit
+    retry_after = max(1, math.ceil(current.reset_at - time.time())) if current else 60
+    return jsonify({
+        'error': 'Too many requests',
+        'answer': "You're sending messages too quickly. Please wait a minute and try again."
+    }), 429, {'Retry-After': str(retry_after)}
+
+# Predefined questions and answers shown in the chat UI
+faq_index = FaqIndex.from_env()
+
+# Server-side chat history per browser session, paged to the frontend
+conversations = create_conversation_store()
+CONVERSATION_PAGE_MAX = int(os.getenv('CONVERSATION_PAGE_MAX', '100'))
+CONVERSATION_MAX_TURN_CHARS = int(os.getenv('CONVERSATION_MAX_TURN_CHARS', '8000'))
+
+def record_turn(session_id, role, text, sources=None, kind='message'):
+    """Append a turn to the session's history; history is best effort and never fails a request"""
+    if not conversations or not session_id:
+        return None
+    try:
+        return conversations.append(session_id, role, text, sources, kind=kind)
+    except Exception as e:
+        logging.error(f"Failed to record conversation turn: {str(e)}")
+        return None
+
+def record_exchange(session_id, message, response):
+    """Record a /predict question and its answer"""
+    record_turn(session_id, 'visitor', message, kind='query')
+    record_turn(session_id, 'operator', response['answer'], response.get('sources'))
+
 # Initialize ChatBot
 def initialize_chatbot():
-    try:
+    # Only the Dialogflow backend needs GCP credentials; the stub runs offline
+    if os.getenv('CHAT_BACKEND', 'dialogflow').lower() == 'dialogflow':
         # Verify all required environment variables are set
         required_vars = ['GOOGLE_APPLICATION_CREDENTIALS', 'GCP_PROJECT_ID', 'AGENT_ID']
         missing_vars = [var for var in required_vars if not os.getenv(var)]
@@ -88,58 +156,147 @@ def initialize_chatbot():
         os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = resolved_path
         
         logging.info("Environment variables loaded successfully")
-        
-        chatbot = ChatBot()
-        logging.info("Vertex AI ChatBot initialized successfully")
-        return chatbot
-        
-    except Exception as e:
-        logging.error(f"Error initializing ChatBot: {str(e)}")
-        return None
+    
+    backend = create_backend()
+    try:
+        chatbot = ChatBot(faq_index=faq_index, backend=backend)
+        chatbot.warm_up()
+    except Exception:
+        # The next attempt builds a new backend, so release this one's clients and refresher thread
+        backend.close()
+        raise
+    logging.info("Vertex AI ChatBot initialized successfully")
+    return chatbot
+
+# Credentials, Dialogflow clients and models load in the background so the
+# worker boots immediately; failures are retried with backoff until it succeeds
+chatbot_loader = BackgroundInitializer.from_env(initialize_chatbot, name='chatbot')
+chatbot_loader.start()
+
+def current_chatbot():
+    """The ChatBot, or None while it is still initializing"""
+    return chatbot_loader.get()
+
+def chatbot_stats(collect):
+    """Gauge callback reporting ``collect(chatbot)`` once the ChatBot is ready"""
+    def callback():
+        chatbot = current_chatbot()
+        return collect(chatbot) if chatbot else None
+    return callback
 
-chatbot = initialize_chatbot()
+REGISTRY.gauge_callback('chatbot_cache', 'Answer cache statistics', chatbot_stats(lambda bot: bot.cache.stats()))
+REGISTRY.gauge_callback('chatbot_client_pool', 'Agent backend and Dialogflow client pool statistics', chatbot_stats(lambda bot: bot.pool_stats()))
+REGISTRY.gauge_callback('chatbot_sessions', 'Agent session registry statistics', chatbot_stats(lambda bot: bot.sessions.stats()))
+REGISTRY.gauge_callback('chatbot_admission', 'Agent admission control decisions', chatbot_stats(lambda bot: bot.admission.stats() if bot.admission else None))
+REGISTRY.gauge_callback('chatbot_circuit', 'Agent circuit breaker state', chatbot_stats(lambda bot: bot.circuit.stats()))
+REGISTRY.gauge_callback('chatbot_coalescing', 'Identical in-flight agent calls issued vs coalesced', chatbot_stats(lambda bot: bot.inflight.stats()))
+REGISTRY.gauge_callback('chatbot_languages', 'Queries routed to each agent language', chatbot_stats(lambda bot: bot.languages.stats()))
+REGISTRY.gauge_callback('chatbot_conversations', 'Conversation history store statistics', lambda: conversations.stats() if conversations else None)
+REGISTRY.gauge_callback('chatbot_startup', 'ChatBot initialization attempts', lambda: {
+    'ready': chatbot_loader.ready,
+    'attempts': chatbot_loader.status()['attempts'],
+})
+
+# Streaming requests run the upstream call on a bounded pool so a slow agent
+# answer only ever occupies one of STREAM_MAX_CONCURRENCY slots
+STREAM_MAX_CONCURRENCY = int(os.getenv('STREAM_MAX_CONCURRENCY', '8'))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv('STREAM_HEARTBEAT_SECONDS', '5'))
+stream_executor = ThreadPoolExecutor(max_workers=STREAM_MAX_CONCURRENCY, thread_name_prefix='predict-stream')
+stream_slots = threading.BoundedSemaphore(STREAM_MAX_CONCURRENCY)
+
+# Batch answering is an operator tool: disabled unless BATCH_API_TOKEN is set
+BATCH_API_TOKEN = os.getenv('BATCH_API_TOKEN')
+BATCH_MAX_QUERIES = int(os.getenv('BATCH_MAX_QUERIES', '500'))
+BATCH_MAX_CONCURRENCY = int(os.getenv('BATCH_MAX_CONCURRENCY', '4'))
 
 @app.route('/')
 def home():
-    return render_template('base.html')
+    # The chat UI keeps its history in localStorage unless a conversation store is configured
+    return render_template('base.html', server_history=conversations is not None)
+
+@app.route('/faq/<category>')
+@limiter.exempt
+def faq_category(category):
+    """Predefined questions and answers for one category, cacheable by the browser"""
+    details = faq_index.category(category) if faq_index else None
+    if not details:
+        return jsonify({'error': 'Unknown category'}), 404
+    
+    response = jsonify(details)
+    response.cache_control.public = True
+    response.cache_control.max_age = int(os.getenv('FAQ_CACHE_MAX_AGE', '3600'))
+    response.add_etag()
+    return response.make_conditional(request)
+
+def parse_predict_request(chatbot):
+    """Validate a predict request, returning (message, None) or (None, error response)"""
+    if not chatbot:
+        logging.warning(f"Chatbot not ready ({chatbot_loader.status()['state']})")
+        return None, (jsonify({
+            'error': 'Chatbot not initialized',
+            'answer': 'The service is starting up. Please try again in a moment.'
+        }), 503, {'Retry-After': '5'})
+        
+    data = request.get_json()
+    if not data:
+        logging.error("No data received in request")
+        return None, (jsonify({
+            'error': 'No data received',
+            'answer': 'Please provide a valid query.'
+        }), 400)
+    
+    message = data.get('message', '').strip()
+    
+    if not message:
+        logging.error("Empty message received")
+        return None, (jsonify({
+            'error': 'Empty message',
+            'answer': 'Please provide a question or message.'
+        }), 400)
+    
+    return message, None
+
+def conversation_context(chatbot, message):
+    """
+    Keyword arguments tying a query to the visitor's conversation: its language
+    and whether the agent still holds earlier turns, both remembered in the
+    session cookie so every worker sees them
+    """
+    now = time.time()
+    language_code = chatbot.route_language(message, previous=session.get('language_code'))
+    # Agent sessions expire after the same idle time as the registry's
+    follow_up = now - session.get('last_turn_at', 0) < chatbot.sessions.ttl
+    session['language_code'] = language_code
+    session['last_turn_at'] = now
+    return {'language_code': language_code, 'follow_up': follow_up}
 
 @app.route('/predict', methods=['POST'])
 @limiter.limit("10 per minute")
 def predict():
     try:
-        if not chatbot:
-            logging.error("Chatbot not initialized")
-            return jsonify({
-                'error': 'Chatbot not initialized',
-                'answer': 'Service temporarily unavailable. Please check server logs.'
-            }), 503
-            
-        data = request.get_json()
-        if not data:
-            logging.error("No data received in request")
-            return jsonify({
-                'error': 'No data received',
-                'answer': 'Please provide a valid query.'
-            }), 400
-        
-        message = data.get('message', '').strip()
-        
-        if not message:
-            logging.error("Empty message received")
-            return jsonify({
-                'error': 'Empty message',
-                'answer': 'Please provide a question or message.'
-            }), 400
+        chatbot = current_chatbot()
+        with STAGE_LATENCY.time(stage='parse_request'):
+            message, error_response = parse_predict_request(chatbot)
+        if error_response:
+            return error_response
         
         # Log the request
-        logging.info(f"Processing query: {message}")
+        logging.info(f"Processing query: {message}", extra={'event': 'predict.request'})
         
         # Get response from chatbot
-        response = chatbot.chat(message)
-        logging.info(f"Chatbot response: {response}")
+        response = chatbot.chat(message, session_id=session.get('session_id'), **conversation_context(chatbot, message))
+        if payload_logging_enabled():
+            logging.info(f"Chatbot response: {response}")
+        record_exchange(session.get('session_id'), message, response)
         
         return jsonify(response)
         
+    except AdmissionRejected as e:
+        logging.warning(f"Agent admission rejected, retry after {e.retry_after}s")
+        return jsonify({
+            'error': 'Server busy',
+            'answer': 'The service is busy right now. Please try again in a moment.'
+        }), 429, {'Retry-After': str(e.retry_after)}
     except Exception as e:
         error_msg = str(e)
         logging.error(f"Error in predict endpoint: {error_msg}")
@@ -148,23 +305,209 @@ def predict():
             'error': error_msg,
             'answer': 'An error occurred while processing your request. Please try again.'
         }), 500
+
+def format_sse(event):
+    """Encode an event dict as a server-sent event"""
+    return f"data: {json.dumps(event)}\n\n"
+
+@app.route('/predict/stream', methods=['POST'])
+@limiter.limit("10 per minute")
+def predict_stream():
+    """Stream the answer as server-sent events while the agent call runs off-thread"""
+    try:
+        chatbot = current_chatbot()
+        with STAGE_LATENCY.time(stage='parse_request'):
+            message, error_response = parse_predict_request(chatbot)
+        if error_response:
+            return error_response
+    except Exception as e:
+        logging.error(f"Error in predict stream endpoint: {str(e)}")
+        return jsonify({
+            'error': str(e),
+            'answer': 'An error occurred while processing your request. Please try again.'
+        }), 500
+    
+    if not stream_slots.acquire(blocking=False):
+        logging.warning("Streaming capacity exhausted, rejecting request")
+        return jsonify({
+            'error': 'Server busy',
+            'answer': 'The service is busy right now. Please try again in a moment.'
+        }), 503, {'Retry-After': '5'}
+    
+    logging.info(f"Processing streaming query: {message}", extra={'event': 'predict.request'})
+    session_id = session.get('session_id')
+    # Taken before streaming starts, while the session cookie can still be updated
+    context = conversation_context(chatbot, message)
+    events = queue.Queue()
+    
+    def produce():
+        try:
+            for event in chatbot.chat_stream(message, session_id=session_id, **context):
+                if event.get('type') == 'final':
+                    record_exchange(session_id, message, event)
+                events.put(event)
+        except Exception as e:
+            logging.error(f"Error in streaming producer: {str(e)}")
+            events.put({
+                'type': 'error',
+                'error': 'An error occurred while processing your request. Please try again.'
+            })
+        finally:
+            events.put(None)
+            stream_slots.release()
+    
+    stream_executor.submit(produce)
+    
+    def generate():
+        while True:
+            try:
+                event = events.get(timeout=STREAM_HEARTBEAT_SECONDS)
+            except queue.Empty:
+                # Comment line keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+                continue
+            if event is None:
+                break
+            yield format_sse(event)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    
+def batch_flag(name, default):
+    return request.args.get(name, str(default)).lower() in ('1', 'true', 'yes')
+
+@app.route('/predict/batch', methods=['POST'])
+@limiter.limit("10 per hour")
+def predict_batch():
+    """Answer a JSONL body of queries, streaming one JSON result per line and a final summary"""
+    if not BATCH_API_TOKEN:
+        return jsonify({'error': 'Batch API disabled'}), 404
+    supplied = request.headers.get('Authorization', '').removeprefix('Bearer ')
+    if not hmac.compare_digest(supplied.encode('utf-8'), BATCH_API_TOKEN.encode('utf-8')):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    chatbot = current_chatbot()
+    if not chatbot:
+        return jsonify({'error': 'Chatbot not initialized'}), 503, {'Retry-After': '5'}
+    
+    try:
+        items = parse_batch(request.get_data().splitlines(), max_queries=BATCH_MAX_QUERIES)
+        concurrency = min(BATCH_MAX_CONCURRENCY, max(1, int(request.args.get('concurrency', BATCH_MAX_CONCURRENCY))))
+    except (BatchError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    
+    answer_locally = batch_flag('local', True)
+    populate_cache = batch_flag('warm_cache', True)
+    logging.info(
+        f"Processing batch of {len(items)} queries (concurrency {concurrency}, local {answer_locally}, warm cache {populate_cache})",
+        extra={'event': 'predict.batch'}
+    )
     
+    def generate():
+        for result in run_batch(chatbot, items, concurrency, answer_locally, populate_cache):
+            if result.get('type') == 'summary':
+                logging.info(f"Batch finished: {result}", extra={'event': 'predict.batch'})
+            yield json.dumps(result, ensure_ascii=False) + '\n'
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics():
+    """Prometheus-style metrics for this worker process"""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/session/reset', methods=['POST'])
+def reset_session():
+    """Start a fresh agent conversation for this browser session"""
+    chatbot = current_chatbot()
+    if chatbot and 'session_id' in session:
+        chatbot.sessions.end(session['session_id'])
+    if conversations and 'session_id' in session:
+        conversations.clear(session['session_id'])
+    # Agent session ids derive from the Flask one, so a new id starts a new agent conversation
+    session['session_id'] = str(uuid.uuid4())
+    session.pop('language_code', None)
+    session.pop('last_turn_at', None)
+    return jsonify({'status': 'reset'})
+
+@app.route('/conversation', methods=['GET'])
+@limiter.limit("60 per minute")
+def conversation_history():
+    """A page of this session's chat history, oldest turn first; ``before`` pages further back"""
+    if not conversations:
+        return jsonify({'turns': [], 'has_more': False, 'next_before': None})
+    try:
+        before = request.args.get('before', type=int)
+        limit = min(CONVERSATION_PAGE_MAX, max(1, request.args.get('limit', 20, type=int)))
+        return jsonify(conversations.page(session['session_id'], before=before, limit=limit))
+    except Exception as e:
+        logging.error(f"Error loading conversation history: {str(e)}")
+        return jsonify({'error': 'Could not load conversation history'}), 500
+
+@app.route('/conversation', methods=['POST'])
+@limiter.limit("120 per minute")
+def append_conversation():
+    """Record a message the chat UI showed without asking the server, such as a predefined answer"""
+    data = request.get_json(silent=True) or {}
+    role = data.get('role')
+    text = data.get('text')
+    if role not in ROLES or not isinstance(text, str) or not text.strip():
+        return jsonify({'error': 'Expected a role and text'}), 400
+    if len(text) > CONVERSATION_MAX_TURN_CHARS:
+        return jsonify({'error': 'Message too long'}), 413
+    
+    seq = record_turn(session['session_id'], role, text)
+    return jsonify({'seq': seq}), 201
+
+@app.route('/health/live')
+@limiter.exempt
+def liveness_check():
+    """Liveness: the worker is up and serving requests, whether or not the ChatBot is ready"""
+    return jsonify({'status': 'alive'})
+
+@app.route('/health/ready')
+@limiter.exempt
+def readiness_check():
+    """Readiness: the ChatBot is initialized and can take traffic"""
+    startup = chatbot_loader.status()
+    if chatbot_loader.ready:
+        return jsonify({'status': 'ready', 'startup': startup})
+    return jsonify({'status': 'not_ready', 'startup': startup}), 503, {'Retry-After': '5'}
+
 @app.route('/health')
 def health_check():
     """Health check endpoint to verify Vertex AI connectivity"""
+    chatbot = current_chatbot()
     if chatbot:
         return jsonify({
             'status': 'healthy',
             'vertex_ai_initialized': True,
             'project_id': os.getenv('GCP_PROJECT_ID'),
-            'agent_id': os.getenv('AGENT_ID')
+            'agent_id': os.getenv('AGENT_ID'),
+            'startup': chatbot_loader.status(),
+            'cache': chatbot.cache.stats(),
+            'client_pool': chatbot.pool_stats(),
+            'sessions': chatbot.sessions.stats(),
+            'coalescing': chatbot.inflight.stats(),
+            'circuit': chatbot.circuit.stats(),
+            'admission': chatbot.admission.stats() if chatbot.admission else None
         })
     else:
+        startup = chatbot_loader.status()
         return jsonify({
-            'status': 'unhealthy',
+            'status': 'starting' if startup['state'] == 'starting' else 'unhealthy',
             'vertex_ai_initialized': False,
-            'error': 'Vertex AI not initialized'
-        }), 500
+            'error': startup['last_error'] or 'Vertex AI not initialized',
+            'startup': startup
+        }), 503
 
 if __name__ == '__main__':
     try:
@@ -0,0 +1,423 @@
+from google.api_core.exceptions import DeadlineExceeded, ServiceUnavailable
+import abc
+import os
+import math
+import time
+import random
+import hashlib
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from client_pool import CredentialRefresher, SessionsClientPool
+from metrics import STAGE_LATENCY, AGENT_HEDGES
+from resilience import hedged_call
+from extraction import AgentReply, extract_reply
+from logging_config import payload_logging_enabled
+
+logger = logging.getLogger(__name__)
+
+
+def _dialogflow():
+    """The Dialogflow CX client library, imported on first use since loading it takes most of a second"""
+    from google.cloud import dialogflowcx_v3beta1
+    return dialogflowcx_v3beta1
+
+
+class AgentBackend(abc.ABC):
+    """
+    Upstream conversational agent behind ChatBot.
+
+    ``detect_intent`` returns an AgentReply whose ``text`` is None when the
+    agent replied without usable text. Upstream failures are raised as
+    ``google.api_core.exceptions.GoogleAPICallError`` so ChatBot can handle
+    every backend the same way.
+    """
+
+    name = 'agent'
+
+    @abc.abstractmethod
+    def detect_intent(self, query, session_id, language_code, timeout=30.0):
+        """Answer ``query`` within ``timeout`` seconds as an AgentReply"""
+
+    def stream_detect_intent(self, query, session_id, language_code, timeout=30.0):
+        """
+        Yield ``('partial', text)`` as the answer builds up and finish with one
+        ``('final', reply)``. Backends without streaming answer in one piece.
+        """
+        yield 'final', self.detect_intent(query, session_id, language_code, timeout=timeout)
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        """Release clients and background threads"""
+
+
+class DialogflowBackend(AgentBackend):
+    """
+    Dialogflow CX agent reached through a pool of regional SessionsClients.
+
+    With AGENT_HEDGE_LOCATION set, a call that has not succeeded after
+    AGENT_HEDGE_DELAY_SECONDS is also sent to a copy of the agent in that
+    region (AGENT_HEDGE_ID, defaulting to AGENT_ID) and the first answer wins.
+    Sessions are regional, so a hedged answer does not see the conversation
+    held in the primary region.
+    """
+
+    name = 'dialogflow'
+
+    def __init__(self):
+        self.credential_refresher = None
+        self.client_pool = None
+        self.hedge_executor = None
+        self._initialize_vertex_ai()
+
+    def _get_credentials(self):
+        """Load the service account credentials; the token is fetched by the CredentialRefresher"""
+        from google.oauth2 import service_account
+
+        credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+
+        if not credentials_path:
+            raise ValueError("GOOGLE_APPLICATION_CREDENTIALS environment variable not set")
+
+        if not os.path.exists(credentials_path):
+            raise ValueError(f"Credentials file not found: {credentials_path}")
+
+        try:
+            credentials = service_account.Credentials.from_service_account_file(
+                credentials_path,
+                scopes=['https://www.googleapis.com/auth/cloud-platform']
+            )
+
+            return credentials
+
+        except Exception as e:
+            raise Exception(f"Failed to load credentials: {str(e)}")
+
+    def _get_dialogflow_client_options(self, location):
+        """Get client options based on region"""
+        region_endpoints = {
+            "us-central1": "us-central1-dialogflow.googleapis.com:443",
+            "us-east1": "us-east1-dialogflow.googleapis.com:443",
+            "us-west1": "us-west1-dialogflow.googleapis.com:443",
+            "europe-west1": "europe-west1-dialogflow.googleapis.com:443",
+            "europe-west2": "europe-west2-dialogflow.googleapis.com:443",
+            "europe-west3": "europe-west3-dialogflow.googleapis.com:443",
+            "asia-northeast1": "asia-northeast1-dialogflow.googleapis.com:443",
+            "asia-southeast1": "asia-southeast1-dialogflow.googleapis.com:443",
+            "australia-southeast1": "australia-southeast1-dialogflow.googleapis.com:443",
+        }
+
+        if location in region_endpoints:
+            from google.api_core import client_options
+            return client_options.ClientOptions(
+                api_endpoint=region_endpoints[location]
+            )
+        return None
+
+    def _create_sessions_client(self, credentials, location):
+        """Create a Dialogflow CX client with the correct regional endpoint"""
+        client_options = self._get_dialogflow_client_options(location)
+        if client_options:
+            logger.info(f"Using regional endpoint for: {location}")
+            return _dialogflow().SessionsClient(
+                credentials=credentials,
+                client_options=client_options
+            )
+        logger.info("Using default Dialogflow endpoint")
+        return _dialogflow().SessionsClient(credentials=credentials)
+
+    def _initialize_vertex_ai(self):
+        """Initialize Vertex AI with credentials from environment variables"""
+        try:
+            # Get values from environment variables
+            project_id = os.getenv("GCP_PROJECT_ID")
+            agent_id = os.getenv("AGENT_ID")
+            agent_location = os.getenv("AGENT_LOCATION", "us-central1")
+
+            if not all([project_id, agent_id]):
+                raise ValueError("Missing required environment variables for Vertex AI")
+
+            # Optional second region to hedge slow or failing calls to
+            hedge_location = os.getenv("AGENT_HEDGE_LOCATION") or None
+            if hedge_location == agent_location:
+                hedge_location = None
+
+            # Get validated credentials
+            credentials = self._get_credentials()
+
+            # Fetch the first OAuth token and keep it fresh off the request path, so
+            # startup does not wait on the token endpoint while the pool connects
+            self.credential_refresher = CredentialRefresher(
+                credentials,
+                margin=int(os.getenv("CREDENTIAL_REFRESH_MARGIN_SECONDS", "300"))
+            )
+            self.credential_refresher.start()
+
+            # Pool of Dialogflow CX clients per regional endpoint, warmed for the agent's region
+            pool_size = int(os.getenv("DIALOGFLOW_POOL_SIZE", "4"))
+            self.client_pool = SessionsClientPool(
+                lambda location: self._create_sessions_client(credentials, location),
+                size=pool_size,
+                acquire_timeout=float(os.getenv("DIALOGFLOW_POOL_TIMEOUT", "10")),
+                warm_locations=[agent_location] + ([hedge_location] if hedge_location else [])
+            )
+
+            # Store agent details
+            self.agent_id = agent_id
+            self.agent_location = agent_location
+            self.project_id = project_id
+            self.hedge_location = hedge_location
+            self.hedge_agent_id = os.getenv("AGENT_HEDGE_ID") or agent_id
+            self.hedge_delay = float(os.getenv("AGENT_HEDGE_DELAY_SECONDS", "1.5"))
+            self.hedge_executor = None
+            if hedge_location:
+                self.hedge_executor = ThreadPoolExecutor(max_workers=2 * pool_size, thread_name_prefix='dialogflow-hedge')
+                logger.info(f"Hedging Dialogflow calls to {hedge_location} after {self.hedge_delay}s")
+
+            logger.info("Vertex AI and Dialogflow CX initialized successfully")
+
+        except Exception as e:
+            logger.error(f"Error initializing Vertex AI: {str(e)}")
+            # Do not leave the refresher thread and clients of a failed attempt running
+            self.close()
+            raise
+
+    def _extract_reply(self, response):
+        """Extract the AgentReply from a Dialogflow CX response, logging what was matched"""
+        if payload_logging_enabled():
+            # Serializing protobuf messages is costly; only dump them on request
+            logger.info(f"Dialogflow response: {response}")
+        try:
+            reply = extract_reply(response)
+        except Exception as e:
+            logger.error(f"Error extracting response text: {str(e)}")
+            return AgentReply()
+
+        if reply.intent:
+            logger.info(f"Matched intent: {reply.intent}", extra={'event': 'agent.intent'})
+        if not reply.text:
+            logger.warning("No usable text response found in Dialogflow response")
+        return reply
+
+    def _build_detect_intent_request(self, query, session_id, language_code, location=None, agent_id=None):
+        """Build the DetectIntentRequest for a query, for the primary agent unless another is given"""
+        location = location or self.agent_location
+        agent_id = agent_id or self.agent_id
+        session_path = f"projects/{self.project_id}/locations/{location}/agents/{agent_id}/sessions/{session_id}"
+
+        logger.info(f"Query to Vertex AI: {query}", extra={'event': 'agent.request', 'session_path': session_path})
+
+        dialogflow = _dialogflow()
+
+        # Create text input
+        text_input = dialogflow.TextInput(text=query)
+        query_input = dialogflow.QueryInput(
+            text=text_input,
+            language_code=language_code
+        )
+
+        # Create request; data store signals carry the citations used as sources
+        return dialogflow.DetectIntentRequest(
+            session=session_path,
+            query_input=query_input,
+            query_params=dialogflow.QueryParameters(populate_data_store_connection_signals=True),
+        )
+
+    def _detect_intent_in(self, location, agent_id, query, session_id, language_code, timeout):
+        """One detect_intent call against the agent in ``location``"""
+        request = self._build_detect_intent_request(query, session_id, language_code, location, agent_id)
+
+        with self.client_pool.client(location) as client:
+            return client.detect_intent(
+                request=request,
+                timeout=timeout
+            )
+
+    def detect_intent(self, query, session_id, language_code, timeout=30.0):
+        if self.hedge_executor is None:
+            response = self._detect_intent_in(self.agent_location, self.agent_id, query, session_id, language_code, timeout)
+        else:
+            start = time.monotonic()
+            response, hedged, hedge_won = hedged_call(
+                self.hedge_executor,
+                lambda: self._detect_intent_in(self.agent_location, self.agent_id, query, session_id, language_code, timeout),
+                lambda: self._detect_intent_in(self.hedge_location, self.hedge_agent_id, query, session_id, language_code,
+                                               max(0.001, timeout - (time.monotonic() - start))),
+                self.hedge_delay,
+                timeout
+            )
+            if hedged:
+                AGENT_HEDGES.inc(winner='secondary' if hedge_won else 'primary')
+
+        with STAGE_LATENCY.time(stage='extract_response'):
+            return self._extract_reply(response)
+
+    def stream_detect_intent(self, query, session_id, language_code, timeout=30.0):
+        request = self._build_detect_intent_request(query, session_id, language_code)
+
+        partial_texts = []
+        reply = AgentReply()
+        with self.client_pool.client(self.agent_location) as client:
+            responses = client.server_streaming_detect_intent(
+                request=request,
+                timeout=timeout
+            )
+
+            for response in responses:
+                with STAGE_LATENCY.time(stage='extract_response'):
+                    extracted = self._extract_reply(response)
+                if response.response_type == _dialogflow().DetectIntentResponse.ResponseType.PARTIAL:
+                    if extracted.text:
+                        partial_texts.append(extracted.text)
+                        yield 'partial', "\n".join(partial_texts)
+                else:
+                    reply = extracted
+
+        yield 'final', reply
+
+    def close(self):
+        """Stop the credential refresher and close the client pool and hedge executor"""
+        if self.credential_refresher:
+            self.credential_refresher.stop()
+        if self.client_pool:
+            self.client_pool.close()
+        if self.hedge_executor:
+            self.hedge_executor.shutdown(wait=False)
+
+    def stats(self):
+        """Client pool and credential refresh metrics"""
+        return {
+            **self.client_pool.stats(),
+            'credentials': self.credential_refresher.stats(),
+        }
+
+
+_STUB_SENTENCES = [
+    "Pekeliling MQA Bil. {n}/2024 sets out the revised requirements for programme accreditation",
+    "Institutions must submit the complete documentation through the MQA portal before the stated deadline",
+    "APEL.A applicants should prepare a portfolio of experiential learning evidence",
+    "The Malaysian Qualifications Framework defines eight levels of qualifications",
+    "Provisional accreditation is granted before the first intake of students",
+    "Please refer to the guidelines and code of practice for details",
+]
+
+_STUB_URLS = [
+    "https://www.mqa.gov.my/pv4/",
+    "https://www.mqa.gov.my/pv4/mqr.cfm",
+    "https://www.mqa.gov.my/pv4/document/policy/2024/Pekeliling%20MQA%20Bil%201%202024.pdf",
+    "www.mqa.gov.my/policies",
+]
+
+
+class StubBackend(AgentBackend):
+    """
+    Local stand-in for the agent, for load tests without GCP credentials.
+
+    Latency is drawn from a ``fixed``, ``uniform`` or ``lognormal``
+    distribution around ``latency_ms``, a fraction ``error_rate`` of calls
+    fail with ServiceUnavailable, and answers are roughly ``response_chars``
+    long. The answer text depends only on the query, and latencies and
+    failures come from a seeded generator, so runs are repeatable.
+    """
+
+    name = 'stub'
+
+    def __init__(self, latency_ms=800.0, distribution='lognormal', spread=0.5,
+                 error_rate=0.0, response_chars=600, partial_chunks=4, seed=42):
+        if distribution not in ('fixed', 'uniform', 'lognormal'):
+            raise ValueError(f"Unknown stub latency distribution: {distribution}")
+        self.latency_ms = latency_ms
+        self.distribution = distribution
+        self.spread = spread
+        self.error_rate = error_rate
+        self.response_chars = response_chars
+        self.partial_chunks = max(1, partial_chunks)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+        self.calls = 0
+        self.errors = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            latency_ms=float(os.getenv('STUB_LATENCY_MS', '800')),
+            distribution=os.getenv('STUB_LATENCY_DISTRIBUTION', 'lognormal').lower(),
+            spread=float(os.getenv('STUB_LATENCY_SPREAD', '0.5')),
+            error_rate=float(os.getenv('STUB_ERROR_RATE', '0')),
+            response_chars=int(os.getenv('STUB_RESPONSE_CHARS', '600')),
+            partial_chunks=int(os.getenv('STUB_PARTIAL_CHUNKS', '4')),
+            seed=int(os.getenv('STUB_SEED', '42')),
+        )
+
+    def _sample(self):
+        """Draw (latency in seconds, whether the call fails) for one call"""
+        with self._lock:
+            self.calls += 1
+            if self.distribution == 'fixed':
+                latency = self.latency_ms
+            elif self.distribution == 'uniform':
+                latency = self._rng.uniform(self.latency_ms * (1 - self.spread), self.latency_ms * (1 + self.spread))
+            else:
+                # latency_ms is the median, spread the sigma of the underlying normal
+                latency = self._rng.lognormvariate(math.log(max(self.latency_ms, 1e-3)), self.spread)
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        return max(0.0, latency) / 1000.0, failed
+
+    def _reply(self, query):
+        """Deterministic reply of about ``response_chars`` characters for a query"""
+        rng = random.Random(hashlib.sha256(query.encode('utf-8')).digest())
+        lines = []
+        length = 0
+        while length < self.response_chars:
+            line = f"{rng.choice(_STUB_SENTENCES).format(n=rng.randint(1, 12))}, see {rng.choice(_STUB_URLS)}."
+            lines.append(line)
+            length += len(line) + 1
+        return AgentReply(
+            text="\n".join(lines)[:max(self.response_chars, 1)],
+            sources=[{'title': 'MQA Portal', 'uri': rng.choice(_STUB_URLS[:3])}],
+        )
+
+    def _wait(self, latency, timeout, failed):
+        time.sleep(min(latency, timeout))
+        if failed:
+            raise ServiceUnavailable("Stub backend injected failure")
+        if latency > timeout:
+            raise DeadlineExceeded(f"Stub backend exceeded the {timeout:.2f}s timeout")
+
+    def detect_intent(self, query, session_id, language_code, timeout=30.0):
+        latency, failed = self._sample()
+        self._wait(latency, timeout, failed)
+        return self._reply(query)
+
+    def stream_detect_intent(self, query, session_id, language_code, timeout=30.0):
+        latency, failed = self._sample()
+        reply = self._reply(query)
+        step = math.ceil(len(reply.text) / self.partial_chunks)
+        for end in range(step, len(reply.text), step):
+            self._wait(latency / self.partial_chunks, timeout, False)
+            yield 'partial', reply.text[:end]
+        self._wait(latency / self.partial_chunks, timeout, failed)
+        yield 'final', reply
+
+    def stats(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+            }
+
+
+def create_backend():
+    """Backend selected by CHAT_BACKEND (``dialogflow`` or ``stub``)"""
+    name = os.getenv('CHAT_BACKEND', 'dialogflow').lower()
+    if name == 'stub':
+        logger.warning("Using the local stub agent backend; answers are synthetic")
+        return StubBackend.from_env()
+    if name == 'dialogflow':
+        return DialogflowBackend()
+    raise ValueError(f"Unknown CHAT_BACKEND: {name}")
@@ -0,0 +1,233 @@
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from admission import AdmissionRejected
+
+logger = logging.getLogger(__name__)
+
+# Attempts per query when the agent admission budget is exhausted
+_ADMISSION_ATTEMPTS = 3
+
+
+class BatchError(ValueError):
+    """Raised for a malformed batch file"""
+
+
+def parse_batch(lines, max_queries=None):
+    """
+    Parse JSONL batch input into query items.
+
+    Each line is an object with ``message`` (or ``query``) and an optional
+    ``id``; any other fields, such as an expected answer, are echoed back in
+    the result. Blank lines are skipped.
+    """
+    items = []
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            item = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise BatchError(f"Line {number}: invalid JSON ({e.msg})")
+        if not isinstance(item, dict):
+            raise BatchError(f"Line {number}: expected a JSON object")
+
+        message = item.pop('message', None) or item.pop('query', None)
+        if not isinstance(message, str) or not message.strip():
+            raise BatchError(f"Line {number}: missing message")
+        items.append({'id': item.pop('id', number), 'message': message.strip(), **item})
+
+        if max_queries and len(items) > max_queries:
+            raise BatchError(f"Batch exceeds the limit of {max_queries} queries")
+    return items
+
+
+def faq_batch(faq_index):
+    """Query items for every predefined question, with the catalog answer as ``expected``"""
+    items = []
+    for category, details in faq_index.categories.items():
+        for position, item in enumerate(details['questions']):
+            items.append({
+                'id': f"{category}-{position}",
+                'message': item['question'],
+                'category': category,
+                'expected': item['answer'],
+            })
+    return items
+
+
+def _percentile(values, fraction):
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))]
+
+
+def _answer(chatbot, item, answer_locally, populate_cache):
+    start = time.perf_counter()
+    result = dict(item)
+    for attempt in range(1, _ADMISSION_ATTEMPTS + 1):
+        try:
+            response = chatbot.chat(item['message'], answer_locally=answer_locally, populate_cache=populate_cache)
+            result.update(response)
+            break
+        except AdmissionRejected as e:
+            if attempt == _ADMISSION_ATTEMPTS:
+                result['error'] = 'Agent capacity exhausted'
+                break
+            time.sleep(e.retry_after)
+        except Exception as e:
+            logger.error(f"Batch query {item['id']} failed: {str(e)}")
+            result['error'] = str(e)
+            break
+    result['latency_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
+def run_batch(chatbot, items, concurrency=4, answer_locally=True, populate_cache=True):
+    """
+    Answer ``items`` through ``chatbot`` with at most ``concurrency`` queries in flight.
+
+    Yields one result per item in completion order (the item's fields plus
+    ``answer``, ``sources``, ``source`` and ``latency_ms``, ``fallback`` when
+    the agent could not answer, or ``error``), then a final
+    ``{'type': 'summary', ...}`` with error and fallback counts, throughput
+    and latency percentiles. Fallback answers are never cached.
+    With ``answer_locally`` off every query goes to the agent, which is what
+    answer-quality checks after an agent change want; ``populate_cache``
+    stores the agent's answers in the answer cache.
+    """
+    concurrency = max(1, concurrency)
+    latencies = []
+    errors = 0
+    fallbacks = 0
+    start = time.perf_counter()
+
+    pending = set()
+    queue = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='batch') as executor:
+        while True:
+            # Keep the window full without submitting the whole batch up front
+            for item in queue:
+                pending.add(executor.submit(_answer, chatbot, item, answer_locally, populate_cache))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                latencies.append(result['latency_ms'])
+                if 'error' in result:
+                    errors += 1
+                elif 'fallback' in result:
+                    fallbacks += 1
+                yield result
+
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    yield {
+        'type': 'summary',
+        'queries': len(latencies),
+        'errors': errors,
+        'fallbacks': fallbacks,
+        'concurrency': concurrency,
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_qps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'p50': _percentile(latencies, 0.50),
+            'p95': _percentile(latencies, 0.95),
+            'p99': _percentile(latencies, 0.99),
+            'max': latencies[-1] if latencies else 0.0,
+        },
+    }
+
+
+def _post_batch(url, token, items, concurrency, answer_locally, populate_cache):
+    """Run the batch on a server through /predict/batch, yielding its JSONL results"""
+    import urllib.parse
+    import urllib.request
+
+    params = urllib.parse.urlencode({
+        'concurrency': concurrency,
+        'local': str(answer_locally).lower(),
+        'warm_cache': str(populate_cache).lower(),
+    })
+    headers = {'Content-Type': 'application/x-ndjson'}
+    if token:
+        headers['Authorization'] = f"Bearer {token}"
+    request = urllib.request.Request(
+        f"{url.rstrip('/')}/predict/batch?{params}",
+        data=''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items).encode('utf-8'),
+        headers=headers,
+        method='POST'
+    )
+    with urllib.request.urlopen(request) as response:
+        for line in response:
+            if line.strip():
+                yield json.loads(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description="Answer a JSONL file of queries ({\"id\": ..., \"message\": ...} per line) and write JSONL results"
+    )
+    parser.add_argument('input', nargs='?', help="JSONL file of queries, '-' for stdin")
+    parser.add_argument('--faq', action='store_true', help="Use every predefined FAQ question as the batch")
+    parser.add_argument('--recent', type=int, metavar='N',
+                        help="Use the N most recent distinct questions from the sqlite:// CONVERSATION_STORE_URI")
+    parser.add_argument('--output', '-o', help="Write results here instead of stdout")
+    parser.add_argument('--concurrency', '-c', type=int, default=4)
+    parser.add_argument('--agent-only', action='store_true', help="Skip FAQ, cache and local retrieval answers")
+    parser.add_argument('--no-warm-cache', action='store_true', help="Do not store agent answers in the cache")
+    parser.add_argument('--url', help="Run on a server's /predict/batch instead of in this process; warms only the serving worker's cache")
+    parser.add_argument('--token', default=os.getenv('BATCH_API_TOKEN'), help="Bearer token for --url (default: BATCH_API_TOKEN)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.faq:
+        from faq_index import FaqIndex
+        queries = faq_batch(FaqIndex.load())
+    elif args.recent:
+        from conversations import create_conversation_store
+        store = create_conversation_store()
+        recent = store.recent_queries(args.recent) if store else []
+        queries = [{'id': f"recent-{i}", 'message': query} for i, query in enumerate(recent, start=1)]
+    elif args.input:
+        with (sys.stdin if args.input == '-' else open(args.input, encoding='utf-8')) as f:
+            queries = parse_batch(f)
+    else:
+        parser.error("give an input file, --faq or --recent")
+
+    if args.url:
+        results = _post_batch(args.url, args.token, queries, args.concurrency, not args.agent_only, not args.no_warm_cache)
+    else:
+        from chat import ChatBot
+        results = run_batch(ChatBot(), queries, args.concurrency, not args.agent_only, not args.no_warm_cache)
+
+    output = open(args.output, 'w', encoding='utf-8') if args.output else sys.stdout
+    try:
+        for result in results:
+            output.write(json.dumps(result, ensure_ascii=False) + '\n')
+            output.flush()
+            if result.get('type') == 'summary':
+                latency = result['latency_ms']
+                print(
+                    f"{result['queries']} queries, {result['errors']} errors, {result['fallbacks']} fallbacks in {result['elapsed_seconds']}s: "
+                    f"{result['throughput_qps']} q/s, p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms",
+                    file=sys.stderr
+                )
+    finally:
+        if output is not sys.stdout:
+            output.close()
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark for Dialogflow CX response extraction.
+
+Compares the previous hasattr-chain extractor with its str(response) fallback
+scan against the single-pass extraction.extract_reply on the DetectIntentResponse
+fixtures in benchmarks/fixtures (plain text, generative data store answer with
+citations, rich content payload only, and no usable text).
+
+    python benchmarks/bench_extract.py [--repeat 5] [--number 200]
+"""
+import os
+import sys
+import argparse
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.cloud import dialogflowcx_v3beta1 as dialogflow  # noqa: E402
+
+from extraction import extract_reply  # noqa: E402
+
+FIXTURES_DIR = Path(__file__).parent / 'fixtures'
+
+
+def legacy_extract_response_text(response):
+    if hasattr(response, 'query_result') and response.query_result:
+        if hasattr(response.query_result, 'response_messages') and response.query_result.response_messages:
+            text_responses = []
+            for message in response.query_result.response_messages:
+                if hasattr(message, 'text') and message.text:
+                    text_responses.extend(message.text.text)
+            if text_responses:
+                return "\n".join(text_responses)
+
+        if hasattr(response.query_result, 'fulfillment_text') and response.query_result.fulfillment_text:
+            return response.query_result.fulfillment_text
+
+    if hasattr(response, 'query_result') and response.query_result:
+        if hasattr(response.query_result, 'fulfillment_response') and response.query_result.fulfillment_response:
+            if hasattr(response.query_result.fulfillment_response, 'messages') and response.query_result.fulfillment_response.messages:
+                text_responses = []
+                for message in response.query_result.fulfillment_response.messages:
+                    if hasattr(message, 'text') and message.text:
+                        text_responses.extend(message.text.text)
+                if text_responses:
+                    return "\n".join(text_responses)
+
+    if hasattr(response, 'query_result') and response.query_result:
+        if hasattr(response.query_result, 'intent') and response.query_result.intent:
+            response.query_result.intent.display_name
+        try:
+            response_str = str(response)
+            if "Pekeliling" in response_str or "pekeliling" in response_str:
+                lines = response_str.split('\n')
+                pekeliling_lines = [line for line in lines if 'Pekeliling' in line or 'pekeliling' in line]
+                if pekeliling_lines:
+                    return "Information about Pekeliling:\n" + "\n".join(pekeliling_lines[:10])
+        except Exception:
+            pass
+    return None
+
+
+def load_fixtures():
+    for path in sorted(FIXTURES_DIR.glob('*.json')):
+        yield path.stem, dialogflow.DetectIntentResponse.from_json(path.read_text(encoding='utf-8'))
+
+
+def bench(label, func, response, repeat, number):
+    timer = timeit.Timer(lambda: func(response))
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    print(f"  {label:<12} {best * 1e6:10.1f} us/response")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    for name, response in load_fixtures():
+        reply = extract_reply(response)
+        print(f"{name} ({len(dialogflow.DetectIntentResponse.to_json(response))} bytes as JSON)")
+        print(f"  text: {len(reply.text or '')} chars, {len(reply.sources)} sources")
+        legacy = bench("legacy", legacy_extract_response_text, response, args.repeat, args.number)
+        current = bench("single-pass", extract_reply, response, args.repeat, args.number)
+        print(f"  speedup      {legacy / current:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
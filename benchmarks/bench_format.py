@@ -0,0 +1,118 @@
+"""
+Micro-benchmark for the answer formatter.
+
+Compares the previous replace-per-URL implementation of ChatBot._format_response
+with the single-pass formatting.format_response on long, link-heavy answers
+shaped like the agent's Pekeliling and programme listings.
+
+    python benchmarks/bench_format.py [--repeat 5] [--number 200]
+"""
+import os
+import re
+import sys
+import random
+import argparse
+import timeit
+from urllib.parse import urlparse, quote, urlunparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from formatting import format_response, sanitize_url  # noqa: E402
+
+
+def legacy_sanitize_url(url):
+    if not url:
+        return None
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    try:
+        parsed = urlparse(url)
+        if not parsed.netloc:
+            return None
+        return urlunparse((
+            parsed.scheme,
+            parsed.netloc,
+            quote(parsed.path),
+            quote(parsed.params),
+            quote(parsed.query),
+            quote(parsed.fragment)
+        ))
+    except Exception:
+        return None
+
+
+def legacy_format_response(answer):
+    if not answer:
+        return "No answer generated. Please try again."
+    formatted_answer = answer.replace('\n', '<br>')
+    url_pattern = r'(https?://[^\s<>"\'\)]+|www\.[^\s<>"\'\)]+)'
+    urls = re.findall(url_pattern, formatted_answer)
+    for url in urls:
+        sanitized_url = legacy_sanitize_url(url)
+        if sanitized_url:
+            link_html = f'<a href="{sanitized_url}" target="_blank" rel="noopener noreferrer" style="color: #1a3e8c; text-decoration: underline;">{url}</a>'
+            formatted_answer = formatted_answer.replace(url, link_html)
+    return formatted_answer
+
+
+URLS = [
+    "https://www.mqa.gov.my/pv4/",
+    "https://www.mqa.gov.my/pv4/document/policy/2024/Pekeliling%20MQA%20Bil%201%202024.pdf",
+    "https://www.mqa.gov.my/pv4/mqr.cfm",
+    "https://www.mqa.gov.my/pv4/mqr.cfm?nama_ipt=&program=diploma",
+    "www.mqa.gov.my/policies",
+    "www.mqa.gov.my/forms",
+    "https://portal.mqa.gov.my/apel",
+]
+
+SENTENCES = [
+    "Pekeliling MQA Bil. {n}/2024 sets out the revised requirements for programme accreditation",
+    "Institutions must submit the complete documentation through the MQA portal before the stated deadline",
+    "APEL.A applicants should prepare a portfolio of experiential learning evidence",
+    "The Malaysian Qualifications Framework defines eight levels of qualifications",
+    "Please refer to the guidelines & code of practice for details",
+]
+
+
+def build_answer(rng, paragraphs, links_per_paragraph):
+    lines = []
+    for n in range(paragraphs):
+        words = [rng.choice(SENTENCES).format(n=n + 1)]
+        for _ in range(links_per_paragraph):
+            words.append(f"see {rng.choice(URLS)}")
+        lines.append(", ".join(words) + ".")
+    return "\n".join(lines)
+
+
+def bench(label, func, answers, repeat, number):
+    timer = timeit.Timer(lambda: [func(answer) for answer in answers])
+    best = min(timer.repeat(repeat=repeat, number=number)) / (number * len(answers))
+    print(f"  {label:<12} {best * 1e6:10.1f} us/answer")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    scenarios = [
+        ("short, 2 links", 1, 2),
+        ("medium, 20 links", 10, 2),
+        ("long, 120 links", 40, 3),
+    ]
+
+    for name, paragraphs, links in scenarios:
+        answers = [build_answer(rng, paragraphs, links) for _ in range(10)]
+        number = max(1, args.number // paragraphs)
+        print(f"{name} ({sum(map(len, answers)) // len(answers)} chars)")
+        legacy = bench("legacy", legacy_format_response, answers, args.repeat, number)
+        sanitize_url.cache_clear()
+        current = bench("single-pass", format_response, answers, args.repeat, number)
+        print(f"  speedup      {legacy / current:10.1f}x")
+
+
+if __name__ == '__main__':
+    main()
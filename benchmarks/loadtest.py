@@ -0,0 +1,209 @@
+"""
+Load test for the chat endpoints.
+
+Drives /predict (or /predict/stream) with N concurrent clients, each keeping
+its own session cookie, and reports throughput and latency percentiles.
+
+Without --url the app is started in-process on a free port with the local
+stub agent (CHAT_BACKEND=stub) and rate limiting disabled, so it runs on any
+machine without GCP credentials. Tune the stub with the STUB_* variables,
+e.g. STUB_LATENCY_MS=300 STUB_ERROR_RATE=0.02.
+
+    python benchmarks/loadtest.py --concurrency 32 --requests 2000
+    python benchmarks/loadtest.py --url http://127.0.0.1:5000 --endpoint stream
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import logging
+import argparse
+import threading
+import http.cookiejar
+import urllib.error
+import urllib.request
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+TOPICS = [
+    "accreditation requirements for a diploma programme",
+    "provisional accreditation timeline",
+    "APEL.A application documents",
+    "Pekeliling MQA on programme standards",
+    "MQF level descriptors for a master's degree",
+    "recognition of foreign qualifications",
+    "audit of a self-accrediting institution",
+    "code of practice for open and distance learning",
+]
+
+ENDPOINTS = {
+    'predict': '/predict',
+    'stream': '/predict/stream',
+}
+
+
+def build_queries(count, seed):
+    """``count`` distinct questions; the ratio of requests to this controls the cache hit rate"""
+    rng = random.Random(seed)
+    return [f"Question {n}: what is the {rng.choice(TOPICS)}?" for n in range(count)]
+
+
+def start_local_server():
+    """Serve app.py with the stub backend on a free port, returning its base URL"""
+    os.environ.setdefault('CHAT_BACKEND', 'stub')
+    os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    from werkzeug.serving import make_server
+    from app import app
+
+    # One access log line per request would dominate the measurement
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def wait_until_ready(base_url, timeout=60.0):
+    """Poll /health/ready until the ChatBot has finished initializing"""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(base_url.rstrip('/') + '/health/ready', timeout=5) as response:
+                return response.status == 200
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                # Server without a readiness endpoint
+                return True
+        except OSError:
+            pass
+        if time.monotonic() >= deadline:
+            raise SystemExit(f"{base_url} did not become ready within {timeout}s")
+        time.sleep(0.2)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of already sorted values"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, math.ceil(fraction * len(values)) - 1))
+    return values[index]
+
+
+class Client(threading.Thread):
+    """One simulated user sending requests back to back"""
+
+    def __init__(self, base_url, endpoint, queries, next_index, results, timeout):
+        super().__init__(daemon=True)
+        self.url = base_url.rstrip('/') + ENDPOINTS[endpoint]
+        self.queries = queries
+        self.next_index = next_index
+        self.results = results
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def _send(self, query):
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps({'message': query}).encode('utf-8'),
+            headers={'Content-Type': 'application/json'},
+            method='POST'
+        )
+        start = time.perf_counter()
+        first_byte = None
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status = response.status
+                for _ in iter(lambda: response.read1(4096), b''):
+                    if first_byte is None:
+                        first_byte = time.perf_counter() - start
+        except urllib.error.HTTPError as e:
+            status = e.code
+            e.read()
+        except Exception as e:
+            status = type(e).__name__
+        return status, time.perf_counter() - start, first_byte
+
+    def run(self):
+        while True:
+            index = self.next_index()
+            if index is None:
+                return
+            self.results.append(self._send(self.queries[index % len(self.queries)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running server; default starts app.py in-process with the stub backend')
+    parser.add_argument('--endpoint', choices=sorted(ENDPOINTS), default='predict')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=500, help='Total requests across all clients')
+    parser.add_argument('--distinct', type=int, default=200, help='Number of distinct questions cycled through')
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--json', action='store_true', help='Print the report as JSON')
+    args = parser.parse_args()
+
+    base_url = args.url or start_local_server()
+    wait_until_ready(base_url)
+    queries = build_queries(args.distinct, args.seed)
+    random.Random(args.seed).shuffle(queries)
+
+    counter = iter(range(args.requests))
+    counter_lock = threading.Lock()
+
+    def next_index():
+        with counter_lock:
+            return next(counter, None)
+
+    results = []
+    clients = [Client(base_url, args.endpoint, queries, next_index, results, args.timeout) for _ in range(args.concurrency)]
+
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+
+    statuses = Counter(str(status) for status, _, _ in results)
+    ok = sorted(latency for status, latency, _ in results if status == 200)
+    first_bytes = sorted(first for status, _, first in results if status == 200 and first is not None)
+
+    report = {
+        'url': base_url,
+        'endpoint': args.endpoint,
+        'concurrency': args.concurrency,
+        'requests': len(results),
+        'statuses': dict(statuses),
+        'elapsed_seconds': round(elapsed, 3),
+        'throughput_rps': round(len(results) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            name: round(percentile(ok, fraction) * 1000, 1)
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))
+        },
+        'first_byte_ms': {
+            name: round(percentile(first_bytes, fraction) * 1000, 1)
+            for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+        },
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['requests']} requests to {base_url}{ENDPOINTS[args.endpoint]} with {args.concurrency} clients in {elapsed:.2f}s")
+    print(f"  throughput   {report['throughput_rps']:10.2f} req/s")
+    print(f"  statuses     {', '.join(f'{status}: {count}' for status, count in sorted(statuses.items()))}")
+    for name, value in report['latency_ms'].items():
+        print(f"  latency {name:<4} {value:10.1f} ms")
+    for name, value in report['first_byte_ms'].items():
+        print(f"  ttfb {name:<7} {value:10.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+import os
+import time
+import random
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundInitializer:
+    """
+    Builds an expensive object on a background thread and keeps retrying.
+
+    ``get()`` returns None until ``factory()`` has succeeded, so a worker can
+    accept requests (and answer liveness checks) while credentials, clients
+    and models load. Failed attempts are retried with jittered exponential
+    backoff between ``base_delay`` and ``max_delay`` seconds instead of
+    leaving the worker broken until a restart.
+    """
+
+    def __init__(self, factory, name='initializer', base_delay=1.0, max_delay=60.0):
+        self.factory = factory
+        self.name = name
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._value = None
+        self._thread = None
+        self._lock = threading.Lock()
+        self._created_at = time.monotonic()
+
+        self.attempts = 0
+        self.last_error = None
+        self.next_attempt_at = None
+        self.ready_after = None
+
+    @classmethod
+    def from_env(cls, factory, name='initializer'):
+        return cls(
+            factory,
+            name=name,
+            base_delay=float(os.getenv('INIT_RETRY_BASE_SECONDS', '1')),
+            max_delay=float(os.getenv('INIT_RETRY_MAX_SECONDS', '60')),
+        )
+
+    def start(self):
+        """Start initializing unless already done or in progress; safe to call on every request"""
+        if self._value is not None:
+            return
+        with self._lock:
+            # A forked worker inherits the flag but not the thread, so check liveness
+            if self._value is None and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name=f"{self.name}-init", daemon=True)
+                self._thread.start()
+
+    def get(self):
+        """The initialized object, or None while it is not ready"""
+        self.start()
+        return self._value
+
+    @property
+    def ready(self):
+        return self._value is not None
+
+    def _run(self):
+        failures = 0
+        while self._value is None:
+            with self._lock:
+                self.attempts += 1
+                self.next_attempt_at = None
+            start = time.monotonic()
+            try:
+                value = self.factory()
+            except Exception as e:
+                failures += 1
+                delay = random.uniform(0.5, 1.0) * min(self.max_delay, self.base_delay * 2 ** (failures - 1))
+                with self._lock:
+                    self.last_error = str(e)
+                    self.next_attempt_at = time.monotonic() + delay
+                logger.error(f"Initializing {self.name} failed (attempt {failures}), retrying in {delay:.1f}s: {str(e)}")
+                time.sleep(delay)
+                continue
+
+            with self._lock:
+                self._value = value
+                self.last_error = None
+                self.ready_after = time.monotonic() - self._created_at
+            logger.info(f"{self.name} ready after {self.attempts} attempt(s), {time.monotonic() - start:.2f}s for the last one")
+
+    def status(self):
+        with self._lock:
+            if self._value is not None:
+                state = 'ready'
+            elif self.last_error is not None:
+                state = 'retrying'
+            else:
+                state = 'starting'
+            return {
+                'state': state,
+                'attempts': self.attempts,
+                'last_error': self.last_error,
+                'next_attempt_in_seconds': round(max(0.0, self.next_attempt_at - time.monotonic()), 1) if self.next_attempt_at else None,
+                'ready_after_seconds': round(self.ready_after, 2) if self.ready_after is not None else None,
+            }
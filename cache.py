@@ -0,0 +1,172 @@
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+
+from language import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class _CacheEntry:
+    __slots__ = ('value', 'expires_at', 'language_code', 'embedding')
+
+    def __init__(self, value, expires_at, language_code, embedding=None):
+        self.value = value
+        self.expires_at = expires_at
+        self.language_code = language_code
+        self.embedding = embedding
+
+
+class ResponseCache:
+    """
+    In-memory answer cache keyed on normalized query and language code.
+
+    Exact matches are looked up by key. When an embedding model is configured,
+    near-duplicate queries are matched by cosine similarity against the cached
+    entries of the same language. Entries expire after ``ttl`` seconds and the
+    least recently used entry is evicted once ``max_size`` is reached.
+    """
+
+    def __init__(self, max_size=1000, ttl=3600, similarity_threshold=0.92, embedding_model=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embedding_model_name = embedding_model
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._encoder = None
+
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+        if embedding_model:
+            # Loading the model takes seconds; do it off the request path and
+            # fall back to exact matching until it is ready.
+            threading.Thread(target=self._load_encoder, name="cache-encoder-loader", daemon=True).start()
+
+    @classmethod
+    def from_env(cls):
+        """Build a cache from environment variables"""
+        return cls(
+            max_size=int(os.getenv("CACHE_MAX_SIZE", "1000")),
+            ttl=float(os.getenv("CACHE_TTL_SECONDS", "3600")),
+            similarity_threshold=float(os.getenv("CACHE_SIMILARITY_THRESHOLD", "0.92")),
+            embedding_model=os.getenv("CACHE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2") or None,
+        )
+
+    def _load_encoder(self):
+        """Load the sentence-transformers model used for near-duplicate matching"""
+        try:
+            from sentence_transformers import SentenceTransformer
+            self._encoder = SentenceTransformer(self.embedding_model_name)
+            logger.info(f"Semantic cache matching enabled with {self.embedding_model_name}")
+        except Exception as e:
+            logger.warning(f"Semantic cache matching disabled: {str(e)}")
+
+    def _embed(self, text):
+        encoder = self._encoder
+        if encoder is None:
+            return None
+        try:
+            return encoder.encode(text, normalize_embeddings=True)
+        except Exception as e:
+            logger.warning(f"Failed to embed query for cache lookup: {str(e)}")
+            return None
+
+    @staticmethod
+    def make_key(query, language_code):
+        return f"{language_code}:{normalize_query(query)}"
+
+    def _purge_expired(self, now):
+        expired = [key for key, entry in self._entries.items() if entry.expires_at <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, query, language_code):
+        """Return the cached answer for a query, or None on a miss"""
+        key = self.make_key(query, language_code)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            # Expired entries stay until evicted so get_stale can still serve them
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry.value
+
+        # Embed outside the lock; the model call dominates lookup cost
+        embedding = self._embed(normalize_query(query))
+
+        with self._lock:
+            if embedding is not None:
+                best_key, best_score = None, self.similarity_threshold
+                for candidate_key, candidate in self._entries.items():
+                    if (candidate.embedding is None
+                            or candidate.language_code != language_code
+                            or candidate.expires_at <= now):
+                        continue
+                    score = float(candidate.embedding @ embedding)
+                    if score >= best_score:
+                        best_key, best_score = candidate_key, score
+
+                if best_key is not None:
+                    self._entries.move_to_end(best_key)
+                    self.hits += 1
+                    self.semantic_hits += 1
+                    return self._entries[best_key].value
+
+            self.misses += 1
+            return None
+
+    def get_stale(self, query, language_code):
+        """Return the cached answer for a query even if it has expired, for when the agent is unavailable"""
+        key = self.make_key(query, language_code)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self.stale_hits += 1
+            return entry.value
+
+    def set(self, query, language_code, value):
+        """Store an answer for a query"""
+        key = self.make_key(query, language_code)
+        embedding = self._embed(normalize_query(query))
+        now = time.monotonic()
+
+        with self._lock:
+            self._entries[key] = _CacheEntry(value, now + self.ttl, language_code, embedding)
+            self._entries.move_to_end(key)
+
+            if len(self._entries) > self.max_size:
+                self._purge_expired(now)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'semantic_hits': self.semantic_hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'semantic_matching': self._encoder is not None,
+            }
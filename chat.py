@@ -1,314 +1,402 @@
-from google.cloud import dialogflowcx_v3beta1 as dialogflow
 from google.api_core.exceptions import GoogleAPICallError
-from google.oauth2 import service_account
-from google.auth.transport.requests import Request
 import os
-import re
 import time
+import uuid
 import logging
-from urllib.parse import urlparse, quote, urlunparse
 from dotenv import load_dotenv
+from backends import create_backend
+from cache import ResponseCache
+from retrieval import LocalRetriever
+from sessions import SessionRegistry
+from faq_index import FaqIndex
+from metrics import STAGE_LATENCY, ANSWERS, FALLBACKS, API_ERRORS, AGENT_RETRIES
+from logging_config import configure_logging
+from formatting import format_response, sanitize_url
+from language import LanguageRouter, refers_to_context
+from singleflight import SingleFlight
+from admission import AdmissionController, AdmissionRejected
+from resilience import CircuitBreaker, CircuitOpen, Deadline, RetryPolicy
 
 # Load environment variables
 load_dotenv()
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 class ChatBot:
-    def __init__(self):
-        self._initialize_vertex_ai()
+    def __init__(self, faq_index=None, backend=None):
+        # Dialogflow CX unless CHAT_BACKEND selects another agent backend
+        self.backend = backend if backend is not None else create_backend()
+        # Per-query language_code: detected Malay or English, else the conversation's or LANGUAGE_CODE.
+        # The conversation's language is kept by the caller, e.g. in the Flask session cookie
+        self.languages = LanguageRouter.from_env()
+        self.faq_index = faq_index if faq_index is not None else FaqIndex.from_env()
+        self.cache = ResponseCache.from_env()
+        self.retriever = LocalRetriever.from_env()
+        self.sessions = SessionRegistry.from_env()
+        self.inflight = SingleFlight()
+        self.admission = AdmissionController.from_env()
+        # End-to-end time budget per request, shared by admission, retries and the agent call
+        self.agent_budget = float(os.getenv("AGENT_DEADLINE_SECONDS", "30"))
+        self.retry_policy = RetryPolicy.from_env()
+        self.circuit = CircuitBreaker.from_env()
     
-    def _get_credentials(self):
-        """Get and validate credentials"""
-        credentials_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-        
-        if not credentials_path:
-            raise ValueError("GOOGLE_APPLICATION_CREDENTIALS environment variable not set")
-        
-        if not os.path.exists(credentials_path):
-            raise ValueError(f"Credentials file not found: {credentials_path}")
-        
-        try:
-            credentials = service_account.Credentials.from_service_account_file(
-                credentials_path,
-                scopes=['https://www.googleapis.com/auth/cloud-platform']
-            )
-            
-            # Refresh the token to ensure it's valid
-            credentials.refresh(Request())
-            
-            return credentials
-            
-        except Exception as e:
-            raise Exception(f"Failed to load credentials: {str(e)}")
-    
-    def _get_dialogflow_client_options(self, location):
-        """Get client options based on region"""
-        region_endpoints = {
-            "us-central1": "us-central1-dialogflow.googleapis.com:443",
-            "us-east1": "us-east1-dialogflow.googleapis.com:443",
-            "us-west1": "us-west1-dialogflow.googleapis.com:443",
-            "europe-west1": "europe-west1-dialogflow.googleapis.com:443",
-            "europe-west2": "europe-west2-dialogflow.googleapis.com:443",
-            "europe-west3": "europe-west3-dialogflow.googleapis.com:443",
-            "asia-northeast1": "asia-northeast1-dialogflow.googleapis.com:443",
-            "asia-southeast1": "asia-southeast1-dialogflow.googleapis.com:443",
-            "australia-southeast1": "australia-southeast1-dialogflow.googleapis.com:443",
-        }
-        
-        if location in region_endpoints:
-            from google.api_core import client_options
-            return client_options.ClientOptions(
-                api_endpoint=region_endpoints[location]
-            )
-        return None
-    
-    def _initialize_vertex_ai(self):
-        """Initialize Vertex AI with credentials from environment variables"""
-        try:
-            # Get values from environment variables
-            project_id = os.getenv("GCP_PROJECT_ID")
-            agent_id = os.getenv("AGENT_ID")
-            agent_location = os.getenv("AGENT_LOCATION", "us-central1")
-            language_code = os.getenv("LANGUAGE_CODE", "en")
-            
-            if not all([project_id, agent_id]):
-                raise ValueError("Missing required environment variables for Vertex AI")
-            
-            # Get validated credentials
-            credentials = self._get_credentials()
-            
-            # Initialize Dialogflow CX client with correct regional endpoint
-            client_options = self._get_dialogflow_client_options(agent_location)
-            if client_options:
-                self.dialogflow_client = dialogflow.SessionsClient(
-                    credentials=credentials,
-                    client_options=client_options
-                )
-                logger.info(f"Using regional endpoint for: {agent_location}")
-            else:
-                self.dialogflow_client = dialogflow.SessionsClient(credentials=credentials)
-                logger.info("Using default Dialogflow endpoint")
-            
-            # Store agent details
-            self.agent_id = agent_id
-            self.agent_location = agent_location
-            self.project_id = project_id
-            self.language_code = language_code
-            
-            logger.info("Vertex AI and Dialogflow CX initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"Error initializing Vertex AI: {str(e)}")
-            raise
+    def warm_up(self):
+        """Load lazily initialized models ahead of the first request"""
+        if self.retriever:
+            self.retriever.warm_up()
     
     def _sanitize_url(self, url):
         """Sanitize and validate URLs to prevent about:blank#blocked errors"""
-        if not url:
-            return None
-        
-        if not url.startswith(('http://', 'https://')):
-            url = 'https://' + url
-        
-        try:
-            parsed = urlparse(url)
-            if not parsed.netloc:
-                return None
-            
-            sanitized_url = urlunparse((
-                parsed.scheme,
-                parsed.netloc,
-                quote(parsed.path),
-                quote(parsed.params),
-                quote(parsed.query),
-                quote(parsed.fragment)
-            ))
-            
-            return sanitized_url
-        except Exception:
-            return None
+        return sanitize_url(url)
     
     def _format_response(self, answer):
         """Format the response with proper HTML formatting and safe clickable links"""
-        if not answer:
-            return "No answer generated. Please try again."
-        
-        # Format line breaks
-        formatted_answer = answer.replace('\n', '<br>')
+        return format_response(answer)
+    
+    def _agent_session_id(self, session_id):
+        """Map a Flask session id to its Dialogflow session, or a one-off session without one"""
+        if session_id:
+            return self.sessions.touch(session_id)
+        return uuid.uuid4().hex
+    
+    def route_language(self, query, previous=None):
+        """Language code to answer the query in, keeping ``previous``, the conversation's language, when the query is ambiguous"""
+        return self.languages.route(query, previous=previous)
+    
+    def _fallback_answer(self, query, sources=None):
+        """
+        Answer used when the agent responded without any usable text, returning
+        (answer, sources, reason) with whatever links the agent did send
+        """
+        sources = sources or []
+        logger.warning("No response text could be extracted from Dialogflow")
         
-        # Find and format URLs safely
-        url_pattern = r'(https?://[^\s<>"\'\)]+|www\.[^\s<>"\'\)]+)'
-        urls = re.findall(url_pattern, formatted_answer)
+        # Provide more specific fallback based on the query
+        if "pekeliling" in query.lower():
+            FALLBACKS.inc(reason='no_text_pekeliling')
+            return "I understand you're asking about Pekeliling documents. However, I'm currently unable to retrieve the specific Pekeliling information from our knowledge base. Please try rephrasing your question or contact MQA directly for the most up-to-date Pekeliling documents.", sources, 'no_text_pekeliling'
+        else:
+            FALLBACKS.inc(reason='no_text')
+            return "I couldn't generate a proper response for your query. Please try rephrasing or ask about a different topic.", sources, 'no_text'
+    
+    def _degraded_answer(self, query, language_code):
+        """Best answer available without the agent: a stale cached answer or a weaker local match"""
+        cached = self.cache.get_stale(query, language_code)
+        if cached is not None:
+            logger.info("Agent unavailable, answer served from stale cache", extra={'event': 'answer.cache'})
+            return cached
         
-        for url in urls:
-            sanitized_url = self._sanitize_url(url)
-            if sanitized_url:
-                link_html = f'<a href="{sanitized_url}" target="_blank" rel="noopener noreferrer" style="color: #1a3e8c; text-decoration: underline;">{url}</a>'
-                formatted_answer = formatted_answer.replace(url, link_html)
+        local_result = self.retriever.answer(query, score_threshold=self.retriever.degraded_threshold) if self.retriever else None
+        if local_result:
+            logger.info(f"Agent unavailable, answer served from local retrieval (score {local_result['score']:.3f})", extra={'event': 'answer.local'})
+            return local_result['answer'], local_result['sources']
         
-        return formatted_answer
+        return None
+    
+    def _unavailable_answer(self, query, reason, language_code):
+        """Answer used when the agent failed or the circuit is open, returning (answer, sources, reason)"""
+        FALLBACKS.inc(reason=reason)
+        degraded = self._degraded_answer(query, language_code)
+        if degraded:
+            return (*degraded, reason)
+        return "Sorry, I encountered an error with the AI service. Please try again in a moment.", [], reason
+    
+    def _attempt_timeout(self, deadline):
+        """Timeout for the next agent attempt, claiming the circuit breaker's permission to call"""
+        timeout = deadline.check(self.retry_policy.min_timeout)
+        if not self.circuit.allow():
+            raise CircuitOpen()
+        return timeout
     
-    def _extract_response_text(self, response):
-        """Extract text response from Dialogflow CX response object"""
+    def _backoff(self, error, attempt, deadline):
+        """Record a failed attempt and sleep before the next one, or re-raise when giving up"""
+        self.circuit.record_error(error)
+        delay = self.retry_policy.next_delay(error, attempt, deadline)
+        if delay is None:
+            raise error
+        AGENT_RETRIES.inc(error=type(error).__name__)
+        logger.warning(f"Agent call failed with {type(error).__name__}, retry {attempt} in {delay:.2f}s")
+        time.sleep(delay)
+    
+    def _call_vertex_ai_agent(self, query, session_id=None, deadline=None, populate_cache=True, language_code=None):
+        """
+        Call Vertex AI Agent Builder API, returning (answer, sources, fallback
+        reason or None); only real agent answers are cached
+        """
+        deadline = deadline or Deadline(self.agent_budget)
+        language_code = language_code or self.languages.default_language
         try:
-            logger.info("Attempting to extract response text...")
+            agent_session_id = self._agent_session_id(session_id)
             
-            # Method 1: Check response messages in query_result
-            if hasattr(response, 'query_result') and response.query_result:
-                logger.info("Found query_result in response")
-                
-                # Check response_messages
-                if hasattr(response.query_result, 'response_messages') and response.query_result.response_messages:
-                    logger.info(f"Found {len(response.query_result.response_messages)} response messages")
-                    text_responses = []
-                    for i, message in enumerate(response.query_result.response_messages):
-                        logger.info(f"Message {i}: {message}")
-                        if hasattr(message, 'text') and message.text:
-                            text_responses.extend(message.text.text)
-                            logger.info(f"Text message found: {message.text.text}")
-                        elif hasattr(message, 'payload') and message.payload:
-                            logger.info(f"Payload message: {message.payload}")
-                    
-                    if text_responses:
-                        combined_text = "\n".join(text_responses)
-                        logger.info(f"Combined text from response_messages: {combined_text}")
-                        return combined_text
-                
-                # Method 2: Check fulfillment_text
-                if hasattr(response.query_result, 'fulfillment_text') and response.query_result.fulfillment_text:
-                    logger.info(f"Found fulfillment_text: {response.query_result.fulfillment_text}")
-                    return response.query_result.fulfillment_text
-            
-            # Method 3: Check fulfillment_response messages
-            if hasattr(response, 'query_result') and response.query_result:
-                if hasattr(response.query_result, 'fulfillment_response') and response.query_result.fulfillment_response:
-                    if hasattr(response.query_result.fulfillment_response, 'messages') and response.query_result.fulfillment_response.messages:
-                        logger.info(f"Found {len(response.query_result.fulfillment_response.messages)} fulfillment messages")
-                        text_responses = []
-                        for i, message in enumerate(response.query_result.fulfillment_response.messages):
-                            logger.info(f"Fulfillment message {i}: {message}")
-                            if hasattr(message, 'text') and message.text:
-                                text_responses.extend(message.text.text)
-                                logger.info(f"Fulfillment text: {message.text.text}")
-                        
-                        if text_responses:
-                            combined_text = "\n".join(text_responses)
-                            logger.info(f"Combined text from fulfillment: {combined_text}")
-                            return combined_text
-            
-            # Method 4: Check for custom payload or other response types
-            if hasattr(response, 'query_result') and response.query_result:
-                # Log intent information
-                if hasattr(response.query_result, 'intent') and response.query_result.intent:
-                    intent_name = response.query_result.intent.display_name
-                    logger.info(f"Matched intent: {intent_name}")
-                
-                # Try to convert the whole response to string as last resort
+            attempt = 0
+            while True:
+                attempt += 1
+                timeout = self._attempt_timeout(deadline)
                 try:
-                    response_str = str(response)
-                    if "Pekeliling" in response_str or "pekeliling" in response_str:
-                        logger.info("Found Pekeliling reference in response string")
-                        # Extract relevant parts
-                        lines = response_str.split('\n')
-                        pekeliling_lines = [line for line in lines if 'Pekeliling' in line or 'pekeliling' in line]
-                        if pekeliling_lines:
-                            return "Information about Pekeliling:\n" + "\n".join(pekeliling_lines[:10])  # Limit to first 10 lines
-                except:
-                    pass
+                    with STAGE_LATENCY.time(stage='detect_intent'):
+                        reply = self.backend.detect_intent(
+                            query, agent_session_id, language_code,
+                            timeout=timeout
+                        )
+                except Exception as e:
+                    self._backoff(e, attempt, deadline)
+                    continue
+                self.circuit.record_success()
+                break
             
-            logger.warning("No usable text response found in Dialogflow response")
-            return None
+            if reply.text:
+                logger.info(f"Successfully extracted answer: {reply.text[:200]}...", extra={'event': 'agent.response'})  # Log first 200 chars
+                if populate_cache:
+                    self.cache.set(query, language_code, (reply.text, reply.sources))
+                return reply.text, reply.sources, None
+            else:
+                return self._fallback_answer(query, reply.sources)
             
+        except CircuitOpen:
+            logger.warning("Agent circuit open, skipping agent call")
+            return self._unavailable_answer(query, 'circuit_open', language_code)
+        except GoogleAPICallError as e:
+            logger.error(f"Google API call error: {str(e)}")
+            API_ERRORS.inc(error=type(e).__name__)
+            return self._unavailable_answer(query, 'api_error', language_code)
         except Exception as e:
-            logger.error(f"Error extracting response text: {str(e)}")
-            return None
+            logger.error(f"Error calling Vertex AI Agent: {str(e)}")
+            logger.exception("Full traceback:")
+            FALLBACKS.inc(reason='error')
+            return "Sorry, I encountered an error processing your request. Please try again.", [], 'error'
+    
+    def _admitted_agent_call(self, query, session_id=None, deadline=None, populate_cache=True, language_code=None):
+        """Call the agent once the global admission budget allows it"""
+        deadline = deadline or Deadline(self.agent_budget)
+        language_code = language_code or self.languages.default_language
+        if self.circuit.state == CircuitBreaker.OPEN:
+            return self._unavailable_answer(query, 'circuit_open', language_code)
+        if self.admission:
+            self.admission.acquire(max_wait=deadline.remaining())
+        return self._call_vertex_ai_agent(query, session_id, deadline, populate_cache, language_code)
     
-    def _call_vertex_ai_agent(self, query):
-        """Call Vertex AI Agent Builder API"""
+    def _admitted_agent_stream(self, query, session_id=None, deadline=None, language_code=None, populate_cache=True):
+        """Stream the agent's answer once the global admission budget allows it"""
+        if self.circuit.state == CircuitBreaker.OPEN:
+            yield 'final', self._unavailable_answer(query, 'circuit_open', language_code)
+            return
+        if self.admission:
+            self.admission.acquire(max_wait=deadline.remaining())
+        yield from self._stream_vertex_ai_agent(query, session_id, deadline, language_code, populate_cache)
+    
+    def _stream_vertex_ai_agent(self, query, session_id=None, deadline=None, language_code=None, populate_cache=True):
+        """
+        Call the agent with server-streaming detect_intent.
+        
+        Yields ``('partial', text)`` for each partial response the agent emits
+        and finishes with exactly one ``('final', (answer, sources, fallback reason or None))``. Failed
+        attempts are retried only until the first partial has been sent.
+        """
+        deadline = deadline or Deadline(self.agent_budget)
+        language_code = language_code or self.languages.default_language
         try:
-            session_id = f"session_{int(time.time())}_{hash(query) % 10000}"
-            session_path = f"projects/{self.project_id}/locations/{self.agent_location}/agents/{self.agent_id}/sessions/{session_id}"
-            
-            logger.info(f"Query to Vertex AI: {query}")
-            logger.info(f"Session path: {session_path}")
-            
-            # Create text input
-            text_input = dialogflow.TextInput(text=query)
-            query_input = dialogflow.QueryInput(
-                text=text_input, 
-                language_code=self.language_code
-            )
-            
-            # Create request
-            request = dialogflow.DetectIntentRequest(
-                session=session_path,
-                query_input=query_input,
-            )
-            
-            # Make API call with timeout
-            logger.info("Sending request to Dialogflow CX...")
-            response = self.dialogflow_client.detect_intent(
-                request=request,
-                timeout=30.0
-            )
-            
-            logger.info("Received response from Dialogflow CX")
+            agent_session_id = self._agent_session_id(session_id)
             
-            # Extract response text using multiple methods
-            answer = self._extract_response_text(response)
+            attempt = 0
+            while True:
+                attempt += 1
+                timeout = self._attempt_timeout(deadline)
+                reply = None
+                streamed = False
+                try:
+                    with STAGE_LATENCY.time(stage='detect_intent_stream'):
+                        for kind, payload in self.backend.stream_detect_intent(
+                            query, agent_session_id, language_code,
+                            timeout=timeout
+                        ):
+                            if kind == 'partial':
+                                streamed = True
+                                yield 'partial', payload
+                            else:
+                                reply = payload
+                except Exception as e:
+                    if streamed:
+                        self.circuit.record_error(e)
+                        raise
+                    self._backoff(e, attempt, deadline)
+                    continue
+                self.circuit.record_success()
+                break
             
-            if answer:
-                logger.info(f"Successfully extracted answer: {answer[:200]}...")  # Log first 200 chars
-                return answer
+            if reply is not None and reply.text:
+                if populate_cache:
+                    self.cache.set(query, language_code, (reply.text, reply.sources))
+                yield 'final', (reply.text, reply.sources, None)
             else:
-                logger.warning("No response text could be extracted from Dialogflow")
-                
-                # Provide more specific fallback based on the query
-                if "pekeliling" in query.lower():
-                    return "I understand you're asking about Pekeliling documents. However, I'm currently unable to retrieve the specific Pekeliling information from our knowledge base. Please try rephrasing your question or contact MQA directly for the most up-to-date Pekeliling documents."
-                else:
-                    return "I couldn't generate a proper response for your query. Please try rephrasing or ask about a different topic."
+                yield 'final', self._fallback_answer(query, reply.sources if reply is not None else None)
             
+        except CircuitOpen:
+            logger.warning("Agent circuit open, skipping agent call")
+            yield 'final', self._unavailable_answer(query, 'circuit_open', language_code)
         except GoogleAPICallError as e:
             logger.error(f"Google API call error: {str(e)}")
-            return "Sorry, I encountered an error with the AI service. Please try again in a moment."
+            API_ERRORS.inc(error=type(e).__name__)
+            yield 'final', self._unavailable_answer(query, 'api_error', language_code)
         except Exception as e:
             logger.error(f"Error calling Vertex AI Agent: {str(e)}")
             logger.exception("Full traceback:")
-            return "Sorry, I encountered an error processing your request. Please try again."
+            FALLBACKS.inc(reason='error')
+            yield 'final', ("Sorry, I encountered an error processing your request. Please try again.", [], 'error')
+    
+    def pool_stats(self):
+        """Agent backend metrics: client pool and credential refresh for Dialogflow"""
+        return {
+            'backend': self.backend.name,
+            **self.backend.stats(),
+        }
+    
+    def _answer_locally(self, query, language_code):
+        """Answer from the FAQ index, the cache or the local document index, returning (answer, sources, source) or None"""
+        # Questions from the predefined catalog need no lookup beyond the index
+        with STAGE_LATENCY.time(stage='faq_lookup'):
+            faq_match = self.faq_index.match(query) if self.faq_index else None
+        if faq_match:
+            logger.info(f"Answer served from FAQ index (score {faq_match['score']:.3f})", extra={'event': 'answer.faq'})
+            ANSWERS.inc(source='faq')
+            category = self.faq_index.category(faq_match['category'])
+            return faq_match['answer'], [{'title': f"MQA FAQ: {category['name']}", 'uri': f"/faq/{faq_match['category']}"}], 'faq'
+        
+        # Serve repeated and near-duplicate questions from the cache
+        with STAGE_LATENCY.time(stage='cache_lookup'):
+            cached = self.cache.get(query, language_code)
+        if cached is not None:
+            logger.info("Answer served from cache", extra={'event': 'answer.cache'})
+            ANSWERS.inc(source='cache')
+            return (*cached, 'cache')
+        
+        # Answer confidently matched questions from the local document index
+        with STAGE_LATENCY.time(stage='local_retrieval'):
+            local_result = self.retriever.answer(query) if self.retriever else None
+        if local_result:
+            logger.info(f"Answer served from local retrieval (score {local_result['score']:.3f})", extra={'event': 'answer.local'})
+            ANSWERS.inc(source='local')
+            return local_result['answer'], local_result['sources'], 'local'
+        
+        return None
     
-    def chat(self, query: str):
+    def _build_result(self, answer, sources, source='agent', fallback=None):
+        """
+        Format an answer into the response returned to the frontend, with
+        ``source`` (faq, cache, local, agent or fallback) and, for fallbacks,
+        the ``fallback`` reason the agent could not answer
+        """
+        if not answer or answer.strip() == '':
+            formatted_answer = "I couldn't find specific information about this. Please try rephrasing your question."
+        else:
+            with STAGE_LATENCY.time(stage='format_response'):
+                formatted_answer = self._format_response(answer)
+        
+        result = {
+            "answer": formatted_answer,
+            "sources": sources,
+            "source": 'fallback' if fallback else source
+        }
+        if fallback:
+            result["fallback"] = fallback
+        return result
+    
+    def _inflight_key(self, query, language_code, session_id, in_context):
+        """Single-flight key: shared for standalone questions, per agent conversation for ones that depend on it"""
+        key = ResponseCache.make_key(query, language_code)
+        if in_context and session_id:
+            return f"{self.sessions.agent_session_id(session_id)}:{key}"
+        return key
+    
+    def chat(self, query: str, session_id: str = None, answer_locally: bool = True, populate_cache: bool = True,
+             language_code: str = None, follow_up: bool = False):
         """
         Process user query using Vertex AI Agent Builder
+        
+        ``session_id`` ties the query to the caller's ongoing agent conversation
+        and ``language_code``, from ``route_language``, is the language to
+        answer in; without it the query's detected language is used.
+        ``follow_up`` marks a query asked while the agent still holds the
+        conversation. When such a query also refers back to earlier turns
+        ("how much does it cost?"), its answer depends on them: the agent
+        answers it without the FAQ index, cache or local retrieval, the answer
+        is not cached and only that conversation's duplicates share the call.
+        ``answer_locally=False`` skips the FAQ index, cache and local retrieval
+        so the agent answers, and ``populate_cache=False`` keeps its answer out
+        of the cache.
         """
+        deadline = Deadline(self.agent_budget)
         try:
             # Validate input
             if not query or not query.strip():
-                return {
-                    "answer": "Please provide a valid question or message.",
-                    "sources": []
-                }
-            
-            # Call Vertex AI Agent Builder
-            answer = self._call_vertex_ai_agent(query)
+                return self._build_result("Please provide a valid question or message.", [], fallback='empty_query')
             
-            # Format the response
-            if not answer or answer.strip() == '':
-                formatted_answer = "I couldn't find specific information about this. Please try rephrasing your question."
+            language_code = language_code or self.route_language(query)
+            in_context = follow_up and refers_to_context(query)
+            local_answer = self._answer_locally(query, language_code) if answer_locally and not in_context else None
+            if local_answer:
+                answer, sources, source = local_answer
+                fallback = None
             else:
-                formatted_answer = self._format_response(answer)
+                # Call Vertex AI Agent Builder, sharing one upstream call between
+                # concurrent identical questions
+                source = 'agent'
+                answer, sources, fallback = self.inflight.do(
+                    self._inflight_key(query, language_code, session_id, in_context),
+                    self._admitted_agent_call, query, session_id, deadline, populate_cache and not in_context, language_code
+                )
+                ANSWERS.inc(source='fallback' if fallback else 'agent')
             
-            return {
-                "answer": formatted_answer,
-                "sources": []
-            }
+            return self._build_result(answer, sources, source, fallback)
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             logger.error(f"Error processing query: {str(e)}")
             logger.exception("Full traceback:")
-            return {
-                "answer": "Sorry, I encountered an error processing your request. Please try again.",
-                "sources": []
-            }
\ No newline at end of file
+            return self._build_result("Sorry, I encountered an error processing your request. Please try again.", [], fallback='error')
+    
+    def chat_stream(self, query: str, session_id: str = None, language_code: str = None, follow_up: bool = False):
+        """
+        Process user query, yielding events as the answer becomes available.
+        
+        ``session_id``, ``language_code`` and ``follow_up`` are used as in ``chat``.
+        Yields ``{"type": "chunk", "text": ...}`` for partial agent output and
+        ends with ``{"type": "final", "answer": ..., "sources": [...]}``.
+        """
+        deadline = Deadline(self.agent_budget)
+        try:
+            if not query or not query.strip():
+                yield {"type": "final", **self._build_result("Please provide a valid question or message.", [], fallback='empty_query')}
+                return
+            
+            language_code = language_code or self.route_language(query)
+            in_context = follow_up and refers_to_context(query)
+            local_answer = None if in_context else self._answer_locally(query, language_code)
+            if local_answer:
+                yield {"type": "final", **self._build_result(*local_answer)}
+                return
+            
+            # Concurrent identical questions follow one upstream stream, partials included
+            for kind, payload in self.inflight.stream(
+                self._inflight_key(query, language_code, session_id, in_context),
+                self._admitted_agent_stream, query, session_id, deadline, language_code, not in_context
+            ):
+                if kind == 'partial':
+                    yield {"type": "chunk", "text": payload}
+                else:
+                    answer, sources, fallback = payload
+                    ANSWERS.inc(source='fallback' if fallback else 'agent')
+                    yield {"type": "final", **self._build_result(answer, sources, fallback=fallback)}
+            
+        except AdmissionRejected as e:
+            yield {
+                "type": "error",
+                "error": "The service is busy right now. Please try again in a moment.",
+                "retry_after": e.retry_after
+            }
+        except Exception as e:
+            logger.error(f"Error processing streaming query: {str(e)}")
+            logger.exception("Full traceback:")
+            yield {"type": "final", **self._build_result("Sorry, I encountered an error processing your request. Please try again.", [], fallback='error')}
\ No newline at end of file
@@ -0,0 +1,217 @@
+import time
+import queue
+import threading
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no client becomes available within the acquire timeout"""
+
+
+class CredentialRefresher:
+    """
+    Keeps service account credentials fresh from a background thread.
+
+    The token is refreshed ``margin`` seconds before it expires so the gRPC
+    auth plugin never has to refresh it inline on a user request.
+    """
+
+    def __init__(self, credentials, margin=300, retry_interval=30):
+        self.credentials = credentials
+        self.margin = margin
+        self.retry_interval = retry_interval
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+        self.refresh_count = 0
+        self.refresh_failures = 0
+        self.last_refresh_latency = None
+        self.max_refresh_latency = 0.0
+
+    def refresh(self):
+        """Refresh the token now and record how long it took"""
+        from google.auth.transport.requests import Request
+
+        start = time.perf_counter()
+        try:
+            self.credentials.refresh(Request())
+        except Exception:
+            with self._lock:
+                self.refresh_failures += 1
+            raise
+        latency = time.perf_counter() - start
+
+        with self._lock:
+            self.refresh_count += 1
+            self.last_refresh_latency = latency
+            self.max_refresh_latency = max(self.max_refresh_latency, latency)
+        logger.info(f"Refreshed Google credentials in {latency * 1000:.0f} ms")
+
+    def seconds_until_expiry(self):
+        expiry = getattr(self.credentials, 'expiry', None)
+        if not expiry:
+            return None
+        # google-auth stores expiry as a naive UTC datetime
+        if expiry.tzinfo is None:
+            expiry = expiry.replace(tzinfo=timezone.utc)
+        return (expiry - datetime.now(timezone.utc)).total_seconds()
+
+    def _run(self):
+        while not self._stop.is_set():
+            remaining = self.seconds_until_expiry()
+            if remaining is not None and remaining > self.margin:
+                self._stop.wait(remaining - self.margin)
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Background credential refresh failed: {str(e)}")
+                self._stop.wait(self.retry_interval)
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="credential-refresher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            remaining = self.seconds_until_expiry()
+            return {
+                'refresh_count': self.refresh_count,
+                'refresh_failures': self.refresh_failures,
+                'last_refresh_latency_ms': round(self.last_refresh_latency * 1000, 1) if self.last_refresh_latency is not None else None,
+                'max_refresh_latency_ms': round(self.max_refresh_latency * 1000, 1),
+                'seconds_until_expiry': round(remaining) if remaining is not None else None,
+            }
+
+
+class SessionsClientPool:
+    """
+    Fixed-size pool of Dialogflow SessionsClient instances per regional endpoint.
+
+    Clients are created up front for the primary location and their gRPC
+    channels are connected in the background so the first requests do not pay
+    the TLS/HTTP2 handshake. Other locations are populated on first use.
+    """
+
+    def __init__(self, client_factory, size=4, acquire_timeout=10.0, warm_locations=()):
+        self.client_factory = client_factory
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+
+        self._pools = {}
+        self._pools_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self.in_use = 0
+        self.acquisitions = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        for location in warm_locations:
+            self._get_pool(location)
+
+    def _get_pool(self, location):
+        with self._pools_lock:
+            pool = self._pools.get(location)
+            if pool is None:
+                pool = queue.LifoQueue(maxsize=self.size)
+                clients = []
+                try:
+                    for _ in range(self.size):
+                        clients.append(self.client_factory(location))
+                except Exception:
+                    self._close_clients(clients)
+                    raise
+                for client in clients:
+                    pool.put(client)
+                self._pools[location] = pool
+                threading.Thread(
+                    target=self._warm_channels,
+                    args=(location, clients),
+                    name=f"warm-{location}",
+                    daemon=True
+                ).start()
+            return pool
+
+    @staticmethod
+    def _warm_channels(location, clients, timeout=10.0):
+        """Connect each client's gRPC channel ahead of the first request"""
+        import grpc
+
+        for client in clients:
+            try:
+                channel = client.transport.grpc_channel
+                grpc.channel_ready_future(channel).result(timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Could not pre-connect channel for {location}: {str(e)}")
+                return
+        logger.info(f"Warmed {len(clients)} Dialogflow channels for {location}")
+
+    @staticmethod
+    def _close_clients(clients):
+        for client in clients:
+            try:
+                client.transport.close()
+            except Exception as e:
+                logger.warning(f"Could not close Dialogflow client: {str(e)}")
+
+    @contextmanager
+    def client(self, location):
+        """Check out a client for ``location`` for the duration of the block"""
+        pool = self._get_pool(location)
+        start = time.perf_counter()
+        try:
+            client = pool.get(timeout=self.acquire_timeout)
+        except queue.Empty:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise PoolTimeout(f"No Dialogflow client available for {location} after {self.acquire_timeout}s")
+        wait = time.perf_counter() - start
+
+        with self._stats_lock:
+            self.in_use += 1
+            self.acquisitions += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+        try:
+            yield client
+        finally:
+            with self._stats_lock:
+                self.in_use -= 1
+            pool.put(client)
+
+    def close(self):
+        """Close the channels of every idle client; clients checked out at the time are left open"""
+        with self._pools_lock:
+            pools = list(self._pools.values())
+            self._pools = {}
+        for pool in pools:
+            while True:
+                try:
+                    self._close_clients([pool.get_nowait()])
+                except queue.Empty:
+                    break
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'size_per_location': self.size,
+                'locations': sorted(self._pools),
+                'in_use': self.in_use,
+                'acquisitions': self.acquisitions,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': round(self.total_wait / self.acquisitions * 1000, 2) if self.acquisitions else 0.0,
+                'max_wait_ms': round(self.max_wait * 1000, 2),
+            }
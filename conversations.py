@@ -0,0 +1,437 @@
+import os
+import json
+import time
+import zlib
+import threading
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+
+from sqlite_db import connect, sqlite_path
+
+logger = logging.getLogger(__name__)
+
+ROLES = ('visitor', 'operator')
+
+# Payload flag bytes: answers are HTML with repeated link markup and compress well
+_RAW = b'j'
+_ZLIB = b'z'
+
+
+def _pack(text, sources, compress_min_bytes):
+    """Encode a turn's text and sources as compact JSON, zlib-compressed when large"""
+    data = json.dumps([text, sources or []], ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    if len(data) >= compress_min_bytes:
+        compressed = zlib.compress(data, 6)
+        if len(compressed) < len(data):
+            return _ZLIB + compressed
+    return _RAW + data
+
+
+def _unpack(payload):
+    payload = bytes(payload)
+    data = zlib.decompress(payload[1:]) if payload[:1] == _ZLIB else payload[1:]
+    return json.loads(data)
+
+
+def _turn(seq, created_at, role, payload):
+    text, sources = _unpack(payload)
+    return {
+        'seq': seq,
+        'role': role,
+        'text': text,
+        'sources': sources,
+        'timestamp': datetime.fromtimestamp(created_at, timezone.utc).isoformat(),
+    }
+
+
+def _page(rows, limit):
+    """Turn newest-first rows (one more than ``limit`` if older ones exist) into a page"""
+    has_more = len(rows) > limit
+    turns = [_turn(*row) for row in reversed(rows[:limit])]
+    return {
+        'turns': turns,
+        'has_more': has_more,
+        'next_before': turns[0]['seq'] if has_more else None,
+    }
+
+
+class _Conversation:
+    __slots__ = ('turns', 'next_seq', 'last_used', 'bytes')
+
+    def __init__(self, max_turns, now):
+        # (seq, created_at, role, kind, payload)
+        self.turns = deque(maxlen=max_turns)
+        self.next_seq = 1
+        self.last_used = now
+        self.bytes = 0
+
+
+class MemoryConversationStore:
+    """
+    Append-only conversation history per Flask ``session_id`` for a single process.
+
+    Each conversation keeps its last ``max_turns`` turns. Conversations idle
+    for ``ttl`` seconds expire, and the least recently active ones are evicted
+    once there are more than ``max_conversations`` or their payloads exceed
+    ``max_bytes`` in total.
+    """
+
+    def __init__(self, max_conversations=10000, max_turns=200, ttl=604800, max_bytes=64 * 1024 * 1024,
+                 compress_min_bytes=256):
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress_min_bytes = compress_min_bytes
+
+        self._conversations = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+
+        self.appended = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def _drop(self, session_id):
+        conversation = self._conversations.pop(session_id)
+        self._bytes -= conversation.bytes
+
+    def _purge_expired(self, now):
+        while self._conversations:
+            session_id, oldest = next(iter(self._conversations.items()))
+            if now - oldest.last_used < self.ttl:
+                break
+            self._drop(session_id)
+            self.expired += 1
+
+    def append(self, session_id, role, text, sources=None, kind='message'):
+        """Append a turn and return its sequence number"""
+        payload = _pack(text, sources, self.compress_min_bytes)
+        now = time.time()
+
+        with self._lock:
+            self._purge_expired(now)
+
+            conversation = self._conversations.get(session_id)
+            if conversation is None:
+                conversation = self._conversations[session_id] = _Conversation(self.max_turns, now)
+            else:
+                self._conversations.move_to_end(session_id)
+
+            if len(conversation.turns) == conversation.turns.maxlen:
+                dropped = len(conversation.turns[0][4])
+                conversation.bytes -= dropped
+                self._bytes -= dropped
+
+            seq = conversation.next_seq
+            conversation.next_seq += 1
+            conversation.turns.append((seq, now, role, kind, payload))
+            conversation.bytes += len(payload)
+            conversation.last_used = now
+            self._bytes += len(payload)
+            self.appended += 1
+
+            # Never evict the conversation just written to
+            while len(self._conversations) > 1 and (
+                len(self._conversations) > self.max_conversations or self._bytes > self.max_bytes
+            ):
+                self._drop(next(iter(self._conversations)))
+                self.evicted += 1
+            return seq
+
+    def page(self, session_id, before=None, limit=20):
+        """
+        Up to ``limit`` turns before sequence number ``before`` (the latest by
+        default), oldest first, with ``has_more`` and the ``next_before`` cursor
+        """
+        with self._lock:
+            conversation = self._conversations.get(session_id)
+            if conversation is None or time.time() - conversation.last_used >= self.ttl:
+                return _page([], limit)
+            rows = []
+            for seq, created_at, role, _, payload in reversed(conversation.turns):
+                if before is not None and seq >= before:
+                    continue
+                rows.append((seq, created_at, role, payload))
+                if len(rows) > limit:
+                    break
+        return _page(rows, limit)
+
+    def clear(self, session_id):
+        with self._lock:
+            if session_id in self._conversations:
+                self._drop(session_id)
+
+    def recent_queries(self, limit=1000):
+        """Distinct questions sent to /predict, most recent first"""
+        with self._lock:
+            rows = [
+                (created_at, payload)
+                for conversation in self._conversations.values()
+                for _, created_at, _, kind, payload in conversation.turns
+                if kind == 'query'
+            ]
+        rows.sort(key=lambda row: row[0], reverse=True)
+        queries = []
+        for _, payload in rows:
+            text = _unpack(payload)[0]
+            if text not in queries:
+                queries.append(text)
+                if len(queries) >= limit:
+                    break
+        return queries
+
+    def stats(self):
+        with self._lock:
+            return {
+                'conversations': len(self._conversations),
+                'max_conversations': self.max_conversations,
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'appended': self.appended,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
+
+
+class SQLiteConversationStore:
+    """
+    Append-only conversation history in a local SQLite file.
+
+    Shared by every gunicorn worker on one host and kept across restarts:
+    ``CONVERSATION_STORE_URI=sqlite:////var/lib/mqa-chatbot/conversations.db``.
+    Each conversation keeps its last ``max_turns`` turns. A sweep at most
+    every ``purge_interval`` seconds deletes conversations idle for ``ttl``
+    seconds and evicts the least recently active ones beyond
+    ``max_conversations`` or ``max_bytes`` of payloads in total. Turn and
+    byte totals are kept per conversation, so neither the sweep nor
+    ``stats`` reads the turns themselves.
+    """
+
+    def __init__(self, path, max_conversations=10000, max_turns=200, ttl=604800, max_bytes=64 * 1024 * 1024,
+                 compress_min_bytes=256, purge_interval=60):
+        self.path = path
+        self.max_conversations = max_conversations
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.compress_min_bytes = compress_min_bytes
+        self.purge_interval = purge_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._next_purge = 0.0
+
+        self.appended = 0
+        self.expired = 0
+        self.evicted = 0
+        # Totals as of the last sweep, reported by stats()
+        self._totals = (0, 0, 0)
+
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS conversations '
+            '(session_id TEXT PRIMARY KEY, next_seq INTEGER NOT NULL, last_used REAL NOT NULL)'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS conversation_turns '
+            '(session_id TEXT NOT NULL, seq INTEGER NOT NULL, created_at REAL NOT NULL, '
+            'role TEXT NOT NULL, kind TEXT NOT NULL, payload BLOB NOT NULL, '
+            'PRIMARY KEY (session_id, seq)) WITHOUT ROWID'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS conversations_last_used ON conversations (last_used)')
+        self._add_totals_columns(connection)
+        self._totals = self._read_totals(connection)
+
+    @staticmethod
+    def _add_totals_columns(connection):
+        """Add the per-conversation turn and byte totals to a database created without them"""
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(conversations)')}
+        if 'bytes' in columns:
+            return
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('ALTER TABLE conversations ADD COLUMN turns INTEGER NOT NULL DEFAULT 0')
+            connection.execute('ALTER TABLE conversations ADD COLUMN bytes INTEGER NOT NULL DEFAULT 0')
+            connection.execute(
+                'UPDATE conversations SET (turns, bytes) = '
+                '(SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM conversation_turns t '
+                'WHERE t.session_id = conversations.session_id)'
+            )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    @staticmethod
+    def _read_totals(connection):
+        return connection.execute(
+            'SELECT COUNT(*), COALESCE(SUM(turns), 0), COALESCE(SUM(bytes), 0) FROM conversations'
+        ).fetchone()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._local.connection = connect(self.path)
+        return connection
+
+    def _purge_expired(self, now):
+        with self._lock:
+            if now < self._next_purge:
+                return
+            self._next_purge = now + self.purge_interval
+
+        cutoff = now - self.ttl
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM conversation_turns WHERE session_id IN '
+                '(SELECT session_id FROM conversations WHERE last_used < ?)', (cutoff,)
+            )
+            expired = connection.execute('DELETE FROM conversations WHERE last_used < ?', (cutoff,)).rowcount
+
+            # Least recently active conversations past either cap, by running totals
+            evict = [(session_id,) for (session_id,) in connection.execute(
+                'SELECT session_id FROM (SELECT session_id, '
+                'ROW_NUMBER() OVER recent AS position, SUM(bytes) OVER recent AS total '
+                'FROM conversations WINDOW recent AS (ORDER BY last_used DESC ROWS UNBOUNDED PRECEDING)) '
+                'WHERE position > ? OR total > ?',
+                (self.max_conversations, self.max_bytes)
+            )]
+            connection.executemany('DELETE FROM conversation_turns WHERE session_id = ?', evict)
+            connection.executemany('DELETE FROM conversations WHERE session_id = ?', evict)
+            totals = self._read_totals(connection)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        with self._lock:
+            self.expired += expired
+            self.evicted += len(evict)
+            self._totals = totals
+
+    def append(self, session_id, role, text, sources=None, kind='message'):
+        """Append a turn and return its sequence number"""
+        payload = _pack(text, sources, self.compress_min_bytes)
+        now = time.time()
+        self._purge_expired(now)
+
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT INTO conversations (session_id, next_seq, last_used, turns, bytes) VALUES (?, 2, ?, 1, ?) '
+                'ON CONFLICT(session_id) DO UPDATE SET next_seq = next_seq + 1, last_used = excluded.last_used, '
+                'turns = turns + 1, bytes = bytes + excluded.bytes',
+                (session_id, now, len(payload))
+            )
+            seq = connection.execute(
+                'SELECT next_seq - 1 FROM conversations WHERE session_id = ?', (session_id,)
+            ).fetchone()[0]
+            connection.execute(
+                'INSERT INTO conversation_turns (session_id, seq, created_at, role, kind, payload) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (session_id, seq, now, role, kind, payload)
+            )
+            trimmed, trimmed_bytes = connection.execute(
+                'SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM conversation_turns '
+                'WHERE session_id = ? AND seq <= ?',
+                (session_id, seq - self.max_turns)
+            ).fetchone()
+            if trimmed:
+                connection.execute(
+                    'DELETE FROM conversation_turns WHERE session_id = ? AND seq <= ?',
+                    (session_id, seq - self.max_turns)
+                )
+                connection.execute(
+                    'UPDATE conversations SET turns = turns - ?, bytes = bytes - ? WHERE session_id = ?',
+                    (trimmed, trimmed_bytes, session_id)
+                )
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        with self._lock:
+            self.appended += 1
+        return seq
+
+    def page(self, session_id, before=None, limit=20):
+        """
+        Up to ``limit`` turns before sequence number ``before`` (the latest by
+        default), oldest first, with ``has_more`` and the ``next_before`` cursor
+        """
+        rows = self._connection().execute(
+            'SELECT t.seq, t.created_at, t.role, t.payload FROM conversation_turns t '
+            'JOIN conversations c ON c.session_id = t.session_id '
+            'WHERE t.session_id = ? AND t.seq < ? AND c.last_used >= ? '
+            'ORDER BY t.seq DESC LIMIT ?',
+            (session_id, before if before is not None else 2 ** 62, time.time() - self.ttl, limit + 1)
+        ).fetchall()
+        return _page(rows, limit)
+
+    def clear(self, session_id):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute('DELETE FROM conversation_turns WHERE session_id = ?', (session_id,))
+            connection.execute('DELETE FROM conversations WHERE session_id = ?', (session_id,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def recent_queries(self, limit=1000):
+        """Distinct questions sent to /predict, most recent first"""
+        queries = []
+        cursor = self._connection().execute(
+            "SELECT payload FROM conversation_turns WHERE kind = 'query' ORDER BY created_at DESC"
+        )
+        for (payload,) in cursor:
+            text = _unpack(payload)[0]
+            if text not in queries:
+                queries.append(text)
+                if len(queries) >= limit:
+                    break
+        return queries
+
+    def stats(self):
+        """Counters of this process, with store totals as of the last sweep"""
+        with self._lock:
+            conversations, turns, size = self._totals
+            return {
+                'conversations': conversations,
+                'max_conversations': self.max_conversations,
+                'turns': turns,
+                'bytes': size,
+                'max_bytes': self.max_bytes,
+                'appended': self.appended,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
+
+
+def create_conversation_store():
+    """
+    Build the conversation store selected by CONVERSATION_STORE_URI, or None
+    when disabled or unset, in which case the chat UI keeps history in the browser
+    """
+    if os.getenv('CONVERSATION_HISTORY_ENABLED', 'true').lower() != 'true':
+        return None
+
+    storage = os.getenv('CONVERSATION_STORE_URI', '')
+    if not storage:
+        logger.info("Conversation history kept in the browser; set CONVERSATION_STORE_URI to keep it on the server")
+        return None
+    limits = {
+        'max_conversations': int(os.getenv('CONVERSATION_MAX_CONVERSATIONS', '10000')),
+        'max_turns': int(os.getenv('CONVERSATION_MAX_TURNS', '200')),
+        'ttl': float(os.getenv('CONVERSATION_TTL_SECONDS', '604800')),
+        'max_bytes': int(os.getenv('CONVERSATION_MAX_BYTES', str(64 * 1024 * 1024))),
+    }
+    if storage.startswith('sqlite://'):
+        store = SQLiteConversationStore(sqlite_path(storage), **limits)
+    else:
+        store = MemoryConversationStore(**limits)
+    logger.info(f"Conversation history enabled: storage {storage}, {limits['max_turns']} turns per conversation")
+    return store
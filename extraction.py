@@ -0,0 +1,109 @@
+import logging
+
+from google.protobuf.struct_pb2 import ListValue, Struct
+
+logger = logging.getLogger(__name__)
+
+
+class AgentReply:
+    """Answer text, cited sources and the matched intent from one agent response"""
+
+    __slots__ = ('text', 'sources', 'intent')
+
+    def __init__(self, text=None, sources=None, intent=None):
+        self.text = text
+        self.sources = sources if sources is not None else []
+        self.intent = intent
+
+
+def _raw(message):
+    """The underlying protobuf of a proto-plus message; field access on it skips proto-plus marshalling"""
+    pb = getattr(type(message), 'pb', None)
+    return pb(message) if pb is not None else message
+
+
+def _field(item, name):
+    # Payloads are read as protobuf Structs, which have no .get()
+    return item[name] if name in item else None
+
+
+def _rich_content(payload):
+    """Items of Dialogflow Messenger rich content in a custom payload Struct"""
+    groups = _field(payload, 'richContent') or []
+    for group in groups:
+        for item in group if isinstance(group, ListValue) else [group]:
+            if isinstance(item, Struct):
+                yield item
+
+
+def _payload_content(payload):
+    """
+    (texts, links) from rich content: info and description cards give answer
+    text, and info, button and chip links give (title, uri) pairs
+    """
+    texts = []
+    links = []
+    for item in _rich_content(payload):
+        kind = _field(item, 'type')
+        if kind == 'info':
+            title, subtitle = _field(item, 'title'), _field(item, 'subtitle')
+            texts.append(': '.join(part for part in (title, subtitle) if part))
+            links.append((title, _field(item, 'actionLink')))
+        elif kind == 'description':
+            lines = _field(item, 'text') or []
+            texts.append("\n".join([_field(item, 'title') or '', *(line for line in lines if isinstance(line, str))]).strip())
+        elif kind == 'button':
+            links.append((_field(item, 'text'), _field(item, 'link')))
+        elif kind == 'chips':
+            for option in _field(item, 'options') or []:
+                if isinstance(option, Struct):
+                    links.append((_field(option, 'text'), _field(option, 'link')))
+    return [text for text in texts if text], links
+
+
+def extract_reply(response):
+    """
+    Extract an AgentReply from a Dialogflow CX DetectIntentResponse in one pass.
+
+    Text comes from ``text`` response messages, falling back to the data store
+    answer for generative responses and then to the info and description
+    cards of rich content payloads. Sources are the data store's cited
+    snippets plus links in rich content payloads, de-duplicated by URI.
+    """
+    query_result = _raw(response).query_result
+
+    texts = []
+    payload_texts = []
+    sources = []
+    seen_uris = set()
+
+    def add_source(title, uri):
+        if uri and uri not in seen_uris:
+            seen_uris.add(uri)
+            sources.append({'title': title or uri, 'uri': uri})
+
+    for message in query_result.response_messages:
+        kind = message.WhichOneof('message')
+        if kind == 'text':
+            texts.extend(text for text in message.text.text if text)
+        elif kind == 'payload':
+            card_texts, links = _payload_content(message.payload)
+            payload_texts.extend(card_texts)
+            for title, uri in links:
+                add_source(title, uri)
+
+    signals = query_result.data_store_connection_signals
+    if not texts and signals.answer:
+        texts.append(signals.answer)
+    if not texts:
+        texts = payload_texts
+    for cited in signals.cited_snippets:
+        add_source(cited.search_snippet.document_title, cited.search_snippet.document_uri)
+
+    intent = query_result.match.intent.display_name or query_result.intent.display_name or None
+
+    return AgentReply(
+        text="\n".join(texts) or None,
+        sources=sources,
+        intent=intent,
+    )
@@ -0,0 +1,167 @@
+import os
+import re
+import json
+import hashlib
+import argparse
+import logging
+from difflib import SequenceMatcher
+from pathlib import Path
+
+from language import normalize_query
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent.absolute()
+DEFAULT_CATALOG_PATH = BASE_DIR / 'data' / 'faq_catalog.json'
+DEFAULT_INDEX_PATH = BASE_DIR / 'data' / 'faq_index.json'
+INDEX_VERSION = 2
+
+# Dots are kept inside tokens so "APEL.A" and "APEL" stay distinct
+_TOKEN_RE = re.compile(r'\w+(?:\.\w+)*')
+_STOPWORDS = frozenset({
+    'a', 'an', 'the', 'is', 'are', 'was', 'what', 'how', 'to', 'do', 'does', 'i', 'can',
+    'of', 'for', 'in', 'on', 'my', 'me', 'be', 'and', 'or', 'with', 'about', 'please',
+    # Malay question and function words; content words are mapped to English by normalize_query
+    'apa', 'apakah', 'itu', 'ini', 'bagaimana', 'macam', 'mana', 'adakah', 'boleh', 'saya',
+    'yang', 'untuk', 'dan', 'atau', 'dengan', 'di', 'ke', 'nak', 'hendak', 'sila', 'tentang',
+})
+
+
+def _stem(token):
+    # Plural folding is enough for short FAQ questions ("fees" vs "fee")
+    return token[:-1] if len(token) > 3 and token.endswith('s') and not token.endswith('ss') else token
+
+
+def content_tokens(normalized_query):
+    """Significant tokens of an already normalized query"""
+    return frozenset(_stem(t) for t in _TOKEN_RE.findall(normalized_query) if t not in _STOPWORDS)
+
+
+def catalog_digest(catalog_path):
+    """Content hash used to tell whether an index was built from the current catalog"""
+    with open(catalog_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def build_index(catalog, digest=None):
+    """Precompute the compact lookup structure for a FAQ catalog"""
+    entries = []
+    for category, details in catalog['categories'].items():
+        for position, item in enumerate(details['questions']):
+            key = normalize_query(item['question'])
+            entries.append([key, sorted(content_tokens(key)), category, position])
+
+    return {
+        'version': INDEX_VERSION,
+        'catalog_sha256': digest,
+        'categories': catalog['categories'],
+        'entries': entries,
+    }
+
+
+class FaqIndex:
+    """
+    Lookup of the predefined MQA questions and answers shown in the chat UI.
+
+    Typed queries are matched exactly on their normalized form first, then
+    fuzzily by a blend of content-token overlap and character similarity.
+    """
+
+    def __init__(self, index, match_threshold=0.82):
+        self.categories = index['categories']
+        self.match_threshold = match_threshold
+
+        self._exact = {}
+        self._entries = []
+        for key, tokens, category, position in index['entries']:
+            self._exact.setdefault(key, (category, position))
+            self._entries.append((key, frozenset(tokens), category, position))
+
+    @classmethod
+    def load(cls, index_path=DEFAULT_INDEX_PATH, catalog_path=DEFAULT_CATALOG_PATH, match_threshold=0.82):
+        """
+        Load the precomputed index, rebuilding it in memory when it is missing
+        or was built from a different version of the catalog
+        """
+        index_path, catalog_path = Path(index_path), Path(catalog_path)
+        digest = catalog_digest(catalog_path) if catalog_path.exists() else None
+
+        if index_path.exists():
+            with open(index_path, encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('version') == INDEX_VERSION and (digest is None or index.get('catalog_sha256') == digest):
+                return cls(index, match_threshold)
+
+        logger.warning(f"FAQ index {index_path} is missing or stale; building it from {catalog_path}")
+        with open(catalog_path, encoding='utf-8') as f:
+            return cls(build_index(json.load(f), digest), match_threshold)
+
+    @classmethod
+    def from_env(cls):
+        """Load the index configured by environment variables, or None if unavailable"""
+        try:
+            return cls.load(
+                index_path=os.getenv("FAQ_INDEX_PATH", str(DEFAULT_INDEX_PATH)),
+                catalog_path=os.getenv("FAQ_CATALOG_PATH", str(DEFAULT_CATALOG_PATH)),
+                match_threshold=float(os.getenv("FAQ_MATCH_THRESHOLD", "0.82")),
+            )
+        except Exception as e:
+            logger.warning(f"FAQ index unavailable: {str(e)}")
+            return None
+
+    def category(self, category):
+        """Return ``{'name', 'questions'}`` for a category, or None"""
+        return self.categories.get(category)
+
+    def _score(self, key, tokens, candidate_key, candidate_tokens):
+        if not tokens or not candidate_tokens:
+            return 0.0
+        overlap = len(tokens & candidate_tokens) / len(tokens | candidate_tokens)
+        similarity = SequenceMatcher(None, key, candidate_key).ratio()
+        return (overlap + similarity) / 2
+
+    def match(self, query):
+        """
+        Return ``{'answer', 'question', 'category', 'score'}`` for the best matching
+        FAQ entry, or None
+        """
+        key = normalize_query(query)
+        found = self._exact.get(key)
+        score = 1.0
+
+        if found is None:
+            tokens = content_tokens(key)
+            best_score = self.match_threshold
+            for candidate_key, candidate_tokens, category, position in self._entries:
+                # Cheap token filter before the character-level comparison
+                if not tokens & candidate_tokens:
+                    continue
+                candidate_score = self._score(key, tokens, candidate_key, candidate_tokens)
+                if candidate_score >= best_score:
+                    found, best_score = (category, position), candidate_score
+            if found is None:
+                return None
+            score = best_score
+
+        category, position = found
+        item = self.categories[category]['questions'][position]
+        return {
+            'answer': item['answer'],
+            'question': item['question'],
+            'category': category,
+            'score': score,
+        }
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Build the precomputed FAQ index from the FAQ catalog")
+    parser.add_argument('--catalog', default=str(DEFAULT_CATALOG_PATH))
+    parser.add_argument('--output', default=str(DEFAULT_INDEX_PATH))
+    args = parser.parse_args()
+
+    with open(args.catalog, encoding='utf-8') as f:
+        built = build_index(json.load(f), catalog_digest(args.catalog))
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(built, f, ensure_ascii=False, separators=(',', ':'))
+    logger.info(f"Wrote {len(built['entries'])} FAQ entries to {args.output}")
@@ -0,0 +1,81 @@
+import re
+from functools import lru_cache
+from html import escape
+from urllib.parse import urlparse, quote, urlunparse
+
+# One pass over the answer: either a URL or a line break
+_TOKEN_RE = re.compile(r'(?P<url>https?://[^\s<>"\'\)]+|www\.[^\s<>"\'\)]+)|(?P<newline>\r?\n)')
+
+# Sentence punctuation directly after a URL belongs to the text, not the link
+_URL_TRAILING_PUNCTUATION = '.,;:!?'
+
+# Characters that are structural in each URL component and must not be re-encoded
+_PATH_SAFE = "/%:@-._~!$&'()*+,;="
+_QUERY_SAFE = "/?%:@-._~!$&'()*+,;="
+
+_LINK_TEMPLATE = (
+    '<a href="{href}" target="_blank" rel="noopener noreferrer" '
+    'style="color: #1a3e8c; text-decoration: underline;">{text}</a>'
+)
+
+
+@lru_cache(maxsize=4096)
+def sanitize_url(url):
+    """Sanitize and validate URLs to prevent about:blank#blocked errors"""
+    if not url:
+        return None
+
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+
+    try:
+        parsed = urlparse(url)
+        if not parsed.netloc:
+            return None
+
+        return urlunparse((
+            parsed.scheme,
+            parsed.netloc,
+            quote(parsed.path, safe=_PATH_SAFE),
+            quote(parsed.params, safe=_PATH_SAFE),
+            quote(parsed.query, safe=_QUERY_SAFE),
+            quote(parsed.fragment, safe=_QUERY_SAFE)
+        ))
+    except Exception:
+        return None
+
+
+def format_response(answer):
+    """
+    Convert agent answer text to HTML in a single pass.
+
+    Text is HTML-escaped, line breaks become ``<br>`` and URLs become safe
+    links. Each URL is handled where it occurs, so one URL being a prefix of
+    another or appearing inside an already generated link cannot corrupt the
+    output.
+    """
+    if not answer:
+        return "No answer generated. Please try again."
+
+    parts = []
+    position = 0
+    for match in _TOKEN_RE.finditer(answer):
+        start, end = match.span()
+        if start > position:
+            parts.append(escape(answer[position:start]))
+
+        url = match.group('url')
+        if url is None:
+            parts.append('<br>')
+        else:
+            stripped = url.rstrip(_URL_TRAILING_PUNCTUATION)
+            sanitized_url = sanitize_url(stripped)
+            if sanitized_url:
+                parts.append(_LINK_TEMPLATE.format(href=escape(sanitized_url), text=escape(stripped)))
+            else:
+                parts.append(escape(stripped))
+            parts.append(escape(url[len(stripped):]))
+        position = end
+
+    parts.append(escape(answer[position:]))
+    return ''.join(parts)
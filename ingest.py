@@ -0,0 +1,288 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+import logging
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dotenv import load_dotenv
+
+from retrieval import LocalRetriever, SUPPORTED_EXTENSIONS
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = 'ingest_manifest.json'
+
+
+def file_sha256(path, block_size=1 << 20):
+    """Hex SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_and_split(path, chunk_size, chunk_overlap):
+    """Parse one PDF/TXT file into (text, metadata) chunks; runs in a worker process"""
+    from langchain_community.document_loaders import PyPDFLoader, TextLoader
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    path = Path(path)
+    if path.suffix.lower() == '.pdf':
+        documents = PyPDFLoader(str(path)).load()
+    else:
+        documents = TextLoader(str(path), encoding='utf-8').load()
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return [
+        (chunk.page_content, chunk.metadata)
+        for chunk in splitter.split_documents(documents)
+        if chunk.page_content.strip()
+    ]
+
+
+class IngestManifest:
+    """
+    Content hash and chunk ids of every indexed file, persisted next to the index.
+
+    Entries are keyed by absolute path, so a file is re-embedded only when its
+    hash changes and its old chunks can be deleted when it changes or goes away.
+    """
+
+    def __init__(self, path, entries=None):
+        self.path = Path(path)
+        self.entries = entries if entries is not None else {}
+
+    @classmethod
+    def load(cls, path):
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        with open(path, encoding='utf-8') as f:
+            return cls(path, json.load(f).get('files', {}))
+
+    def save(self):
+        """Write atomically so an interrupted run leaves the previous manifest intact"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'version': 1, 'files': self.entries}, f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class DocumentIngester:
+    """
+    Incrementally indexes a directory of MQA documents into the LocalRetriever collection.
+
+    Files whose content hash matches the manifest are skipped. New and changed
+    files are parsed and chunked across a process pool, and the chunks are
+    embedded and written in batches of ``batch_size`` as files finish parsing.
+    Chunks of changed and deleted files are removed from the index.
+    """
+
+    def __init__(self, retriever, chunk_size=1000, chunk_overlap=150, batch_size=128, workers=None):
+        self.retriever = retriever
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.batch_size = max(1, batch_size)
+        self.workers = workers or os.cpu_count() or 1
+        self.manifest = IngestManifest.load(Path(retriever.persist_directory) / MANIFEST_NAME)
+
+    @classmethod
+    def from_env(cls, retriever):
+        workers = os.getenv('INGEST_WORKERS')
+        return cls(
+            retriever,
+            chunk_size=int(os.getenv('INGEST_CHUNK_SIZE', '1000')),
+            chunk_overlap=int(os.getenv('INGEST_CHUNK_OVERLAP', '150')),
+            batch_size=int(os.getenv('INGEST_BATCH_SIZE', '128')),
+            workers=int(workers) if workers else None,
+        )
+
+    @staticmethod
+    def _chunk_id(key, content_hash, position):
+        # Stable for unchanged content, distinct for identical files at different paths
+        return hashlib.sha1(f"{key}\0{content_hash}\0{position}".encode('utf-8')).hexdigest()
+
+    def plan(self, documents_dir):
+        """Return (changed, unchanged, removed): [(key, path, sha256)], count, [key]"""
+        root = Path(documents_dir).resolve()
+        paths = sorted(
+            p for p in root.rglob('*')
+            if p.is_file() and p.suffix.lower() in SUPPORTED_EXTENSIONS
+        )
+
+        changed = []
+        unchanged = 0
+        seen = set()
+        for path in paths:
+            key = str(path)
+            seen.add(key)
+            content_hash = file_sha256(path)
+            entry = self.manifest.entries.get(key)
+            if entry and entry['sha256'] == content_hash:
+                unchanged += 1
+            else:
+                changed.append((key, path, content_hash))
+
+        removed = [
+            key for key in self.manifest.entries
+            if key not in seen and Path(key).is_relative_to(root)
+        ]
+        return changed, unchanged, removed
+
+    def _parsed(self, changed):
+        """Yield (key, path, sha256, chunks or None on failure) as files finish parsing"""
+        if self.workers <= 1 or len(changed) <= 1:
+            for key, path, content_hash in changed:
+                try:
+                    yield key, path, content_hash, load_and_split(path, self.chunk_size, self.chunk_overlap)
+                except Exception as e:
+                    logger.error(f"Failed to load {path}: {str(e)}")
+                    yield key, path, content_hash, None
+            return
+
+        # Spawned workers stay clear of the embedding model and threads in this process
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(changed)), mp_context=context) as executor:
+            futures = {
+                executor.submit(load_and_split, str(path), self.chunk_size, self.chunk_overlap): (key, path, content_hash)
+                for key, path, content_hash in changed
+            }
+            for future in as_completed(futures):
+                key, path, content_hash = futures[future]
+                try:
+                    yield key, path, content_hash, future.result()
+                except Exception as e:
+                    logger.error(f"Failed to load {path}: {str(e)}")
+                    yield key, path, content_hash, None
+
+    def _delete(self, ids):
+        if ids:
+            self.retriever.store.delete(ids=ids)
+
+    def rebuild(self):
+        """Drop the collection and the manifest so the next run re-indexes everything"""
+        self.retriever.store.delete_collection()
+        self.retriever._store = None
+        self.manifest.entries = {}
+        self.manifest.save()
+
+    def run(self, documents_dir, dry_run=False):
+        """Bring the index in line with ``documents_dir``, returning counts of what changed"""
+        start = time.perf_counter()
+        changed, unchanged, removed = self.plan(documents_dir)
+        stats = {
+            'unchanged': unchanged,
+            'changed': len(changed),
+            'removed': len(removed),
+            'failed': 0,
+            'chunks_added': 0,
+            'chunks_deleted': 0,
+        }
+        logger.info(f"{len(changed)} new or changed, {unchanged} unchanged and {len(removed)} removed documents")
+        if dry_run:
+            for key, _, _ in changed:
+                logger.info(f"Would index {key}")
+            for key in removed:
+                logger.info(f"Would remove {key}")
+            return stats
+
+        if not self.manifest.entries and (changed or removed) and self.retriever.store.get(limit=1)['ids']:
+            logger.warning("Index has chunks that no manifest tracks; run with --rebuild once to avoid duplicates")
+
+        for key in removed:
+            chunk_ids = self.manifest.entries.pop(key)['chunk_ids']
+            self._delete(chunk_ids)
+            stats['chunks_deleted'] += len(chunk_ids)
+            logger.info(f"Removed {len(chunk_ids)} chunks of deleted {key}")
+        if removed:
+            self.manifest.save()
+
+        batch = []
+        # Files whose chunks are queued but not all written: key -> [entry, chunks still pending]
+        pending = {}
+
+        def commit(key, entry):
+            # New chunks are in place, so the file's previous chunks can go
+            previous = self.manifest.entries.get(key)
+            if previous:
+                self._delete(previous['chunk_ids'])
+                stats['chunks_deleted'] += len(previous['chunk_ids'])
+            self.manifest.entries[key] = entry
+            logger.info(f"Indexed {len(entry['chunk_ids'])} chunks from {key}")
+
+        def flush():
+            if not batch:
+                return
+            self.retriever.store.add_texts(
+                texts=[text for _, _, text, _ in batch],
+                metadatas=[metadata for _, _, _, metadata in batch],
+                ids=[chunk_id for _, chunk_id, _, _ in batch],
+            )
+            stats['chunks_added'] += len(batch)
+            for key, _, _, _ in batch:
+                pending[key][1] -= 1
+                if pending[key][1] == 0:
+                    commit(key, pending.pop(key)[0])
+            batch.clear()
+            self.manifest.save()
+
+        for key, path, content_hash, chunks in self._parsed(changed):
+            if chunks is None:
+                stats['failed'] += 1
+                continue
+            entry = {
+                'sha256': content_hash,
+                'chunk_ids': [self._chunk_id(key, content_hash, i) for i in range(len(chunks))],
+                'indexed_at': time.time(),
+            }
+            if not chunks:
+                commit(key, entry)
+                continue
+
+            pending[key] = [entry, len(chunks)]
+            for chunk_id, (text, metadata) in zip(entry['chunk_ids'], chunks):
+                batch.append((key, chunk_id, text, {**metadata, 'content_hash': content_hash}))
+                if len(batch) >= self.batch_size:
+                    flush()
+        flush()
+        self.manifest.save()
+
+        stats['elapsed_seconds'] = round(time.perf_counter() - start, 2)
+        logger.info(f"Ingestion finished: {stats}")
+        return stats
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(
+        description="Incrementally index MQA PDF/TXT documents into the local vector store"
+    )
+    parser.add_argument('documents_dir', help="Directory containing PDF/TXT documents")
+    parser.add_argument('--persist-directory', default=os.getenv("VECTOR_STORE_DIR", "vector_store"))
+    parser.add_argument('--collection', default=os.getenv("VECTOR_STORE_COLLECTION", "mqa_documents"))
+    parser.add_argument('--workers', type=int, help="Parsing processes (default: INGEST_WORKERS or CPU count)")
+    parser.add_argument('--batch-size', type=int, help="Chunks per embedding batch (default: INGEST_BATCH_SIZE)")
+    parser.add_argument('--rebuild', action='store_true', help="Drop the index and re-embed every document")
+    parser.add_argument('--dry-run', action='store_true', help="Only report which documents would change")
+    args = parser.parse_args()
+
+    retriever = LocalRetriever(
+        persist_directory=args.persist_directory,
+        collection_name=args.collection,
+        embedding_model=os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+    )
+    ingester = DocumentIngester.from_env(retriever)
+    if args.workers:
+        ingester.workers = args.workers
+    if args.batch_size:
+        ingester.batch_size = args.batch_size
+    if args.rebuild and not args.dry_run:
+        ingester.rebuild()
+    print(json.dumps(ingester.run(args.documents_dir, dry_run=args.dry_run), indent=2))
@@ -0,0 +1,199 @@
+import os
+import re
+import unicodedata
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_POSSESSIVE_RE = re.compile(r"['’]s\b")
+# Anything but word characters, whitespace and the joiners kept inside tokens
+_PUNCTUATION_RE = re.compile(r"[^\w\s.\-/]+")
+# Joiners only survive between word characters, so "APEL.A" and "e-learning"
+# keep theirs while "fees?." and "- APEL" lose them
+_LOOSE_JOINER_RE = re.compile(r"(?<!\w)[.\-/]+|[.\-/]+(?!\w)")
+_WHITESPACE_RE = re.compile(r'\s+')
+
+# Informal spellings, Malay domain terms and alternative English forms mapped
+# to one canonical form, so the same question asked in Malay, English or a mix
+# of both shares a cache key and matches the English FAQ catalog
+SYNONYMS = {
+    # Malay chat shorthand
+    'yg': 'yang', 'utk': 'untuk', 'dgn': 'dengan', 'dlm': 'dalam', 'sy': 'saya',
+    'brp': 'berapa', 'mcm': 'macam', 'camne': 'macam mana', 'macamana': 'macam mana',
+    'nk': 'nak', 'bole': 'boleh', 'blh': 'boleh', 'tu': 'itu', 'ni': 'ini', 'kat': 'di',
+    'x': 'tak', 'tk': 'tak', 'sbb': 'sebab', 'org': 'orang', 'mklumat': 'maklumat',
+    # English chat shorthand
+    'pls': 'please', 'plz': 'please', 'u': 'you', 'ur': 'your', 'info': 'information',
+    'cert': 'certificate', 'certs': 'certificates', 'uni': 'university', 'reqs': 'requirements',
+    # Malay domain terms to the English used by the FAQ catalog
+    'akreditasi sementara': 'provisional accreditation',
+    'akreditasi penuh': 'full accreditation',
+    'akreditasi': 'accreditation',
+    'kerangka kelayakan malaysia': 'malaysian qualifications framework',
+    'kelayakan': 'qualification',
+    'pengiktirafan': 'recognition',
+    'kesetaraan': 'equivalency',
+    'yuran': 'fees',
+    'bayaran': 'fees',
+    'sijil': 'certificate',
+    'sarjana muda': 'bachelor',
+    'ijazah sarjana': 'master',
+    'ijazah': 'degree',
+    'kedoktoran': 'doctorate',
+    'garis panduan': 'guidelines',
+    'permohonan': 'application',
+    'mohon': 'apply',
+    'memohon': 'apply',
+    'syarat': 'requirements',
+    'syarat-syarat': 'requirements',
+    'dokumen': 'documents',
+    'institusi': 'institution',
+    'universiti': 'university',
+    'pelajar': 'student',
+    'kredit': 'credits',
+    'pindahan kredit': 'credit transfer',
+    'mikro-kredensial': 'micro-credentials',
+    'aduan': 'complaint',
+    'borang': 'forms',
+    # English variants
+    'equivalence': 'equivalency',
+    'programme': 'program',
+    'programmes': 'programs',
+    'circular': 'pekeliling',
+    'circulars': 'pekeliling',
+    'microcredentials': 'micro-credentials',
+    'micro credentials': 'micro-credentials',
+    # APEL components however they are typed
+    **{f"apel{joiner}{part}": f"apel.{part}" for joiner in (' ', '-', '') for part in 'acqm'},
+}
+
+_SYNONYM_RE = re.compile(
+    r"(?<![\w.\-/])(" + '|'.join(re.escape(term) for term in sorted(SYNONYMS, key=len, reverse=True)) + r")(?![\w.\-/])"
+)
+
+# Function words and common question words that mark a query's language.
+# Domain terms shared by both languages (APEL, MQA, pekeliling) mark neither
+MALAY_MARKERS = frozenset({
+    'apa', 'apakah', 'bagaimana', 'berapa', 'bila', 'bilakah', 'mana', 'manakah', 'siapa',
+    'kenapa', 'mengapa', 'adakah', 'boleh', 'yang', 'untuk', 'dan', 'atau', 'dengan',
+    'dalam', 'saya', 'kami', 'anda', 'awak', 'ini', 'itu', 'ada', 'tidak', 'tak', 'bukan',
+    'sudah', 'belum', 'perlu', 'hendak', 'nak', 'mahu', 'macam', 'di', 'ke', 'dari',
+    'daripada', 'pada', 'oleh', 'juga', 'sahaja', 'tentang', 'mengenai', 'maklumat', 'cara',
+    'senarai', 'terkini', 'bagi', 'kepada', 'sila', 'tolong', 'terima', 'kasih', 'lama',
+    'masa', 'mana-mana', 'sebab', 'orang', 'akreditasi', 'kelayakan', 'yuran', 'sijil',
+    'ijazah', 'permohonan', 'pengiktirafan', 'kesetaraan', 'syarat', 'dokumen', 'borang',
+    'yg', 'utk', 'dgn', 'dlm', 'sy', 'brp', 'mcm', 'camne', 'nk', 'kat', 'sbb',
+})
+ENGLISH_MARKERS = frozenset({
+    'what', 'how', 'when', 'where', 'which', 'who', 'why', 'is', 'are', 'was', 'the', 'a',
+    'an', 'of', 'for', 'to', 'in', 'on', 'and', 'or', 'with', 'about', 'can', 'do', 'does',
+    'i', 'my', 'me', 'you', 'your', 'please', 'need', 'want', 'there', 'this', 'that',
+    'latest', 'list', 'fee', 'fees', 'apply', 'get', 'find', 'long', 'take', 'requirements',
+    'documents', 'process', 'status', 'check', 'many', 'much', 'pls', 'plz',
+})
+# Malay affixes, only trusted on words long enough not to be English by accident
+_MALAY_AFFIX_RE = re.compile(r"^(?:meng|meny|peng|peny|ber)\w{4,}|\w{3,}(?:kan|nya|lah|kah)$")
+
+# Words and openers that point back at earlier turns ("how much does it cost?",
+# "what about APEL.C?", "berapa yurannya?"), after normalization
+CONTEXT_MARKERS = frozenset({
+    'it', 'its', 'this', 'that', 'these', 'those', 'they', 'them', 'their', 'he', 'she', 'him', 'her',
+    'same', 'above', 'previous', 'earlier', 'itu', 'ini', 'tersebut', 'dia', 'mereka', 'tadi',
+})
+_CONTEXT_OPENER_RE = re.compile(r"^(?:and|also|then|so|but|what about|how about|what if|dan|juga|lagi|bagaimana pula|macam mana pula)\b")
+_CONTEXT_SUFFIX_RE = re.compile(r"^\w{3,}nya$")
+
+
+def clean_query(query):
+    """Casefold and strip punctuation and extra whitespace, keeping joiners inside tokens"""
+    if not query:
+        return ''
+    text = unicodedata.normalize('NFKC', query).casefold()
+    text = _POSSESSIVE_RE.sub('', text)
+    text = _PUNCTUATION_RE.sub(' ', text)
+    text = _LOOSE_JOINER_RE.sub(' ', text)
+    return _WHITESPACE_RE.sub(' ', text).strip()
+
+
+def normalize_query(query):
+    """
+    Canonical form of a query for cache, de-duplication and FAQ keys: cleaned
+    up, with Malay and informal terms mapped to the catalog's English terms
+    """
+    return _SYNONYM_RE.sub(lambda match: SYNONYMS[match.group(1)], clean_query(query))
+
+
+def refers_to_context(query):
+    """Whether the query leans on earlier turns of the conversation, so its answer depends on them"""
+    text = normalize_query(query)
+    if _CONTEXT_OPENER_RE.match(text):
+        return True
+    return any(token in CONTEXT_MARKERS or _CONTEXT_SUFFIX_RE.match(token) for token in text.split())
+
+
+def detect_language(query):
+    """'ms' or 'en' from the query's marker words, or None when it gives no clear signal"""
+    malay = english = 0.0
+    for token in clean_query(query).split():
+        if token in MALAY_MARKERS:
+            malay += 1
+        elif token in ENGLISH_MARKERS:
+            english += 1
+        elif _MALAY_AFFIX_RE.match(token):
+            malay += 0.5
+    if malay > english:
+        return 'ms'
+    if english > malay:
+        return 'en'
+    return None
+
+
+class LanguageRouter:
+    """
+    Picks the agent ``language_code`` for each query.
+
+    Detected languages are used when the agent supports them. Queries without
+    a clear signal (a bare "APEL.A") keep the language of the conversation they
+    are part of, falling back to ``default_language``.
+    """
+
+    def __init__(self, default_language='en', languages=None, detection_enabled=True):
+        self.default_language = default_language
+        self.detection_enabled = detection_enabled
+        # Base language ("ms") to the code the agent is configured with ("ms" or "ms-MY")
+        self._codes = {}
+        for code in [default_language, *(languages or [])]:
+            self._codes.setdefault(code.split('-')[0].lower(), code)
+        self._lock = threading.Lock()
+        self.routed = {}
+        self.undetected = 0
+
+    @classmethod
+    def from_env(cls):
+        default_language = os.getenv('LANGUAGE_CODE', 'en')
+        languages = [code.strip() for code in os.getenv('AGENT_LANGUAGES', default_language).split(',') if code.strip()]
+        return cls(
+            default_language=default_language,
+            languages=languages,
+            detection_enabled=os.getenv('LANGUAGE_DETECTION_ENABLED', 'true').lower() == 'true',
+        )
+
+    def route(self, query, previous=None):
+        """The language_code to answer ``query`` in; ``previous`` is the conversation's last one"""
+        detected = detect_language(query) if self.detection_enabled else None
+        code = self._codes.get(detected)
+        if code is None:
+            code = previous if previous in self._codes.values() else self.default_language
+        with self._lock:
+            if detected is None:
+                self.undetected += 1
+            self.routed[code] = self.routed.get(code, 0) + 1
+        return code
+
+    def stats(self):
+        with self._lock:
+            return {
+                'undetected': self.undetected,
+                **{f"routed_{code.replace('-', '_')}": count for code, count in self.routed.items()},
+            }
@@ -0,0 +1,156 @@
+import os
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RESERVED_ATTRS = frozenset(vars(logging.makeLogRecord({})).keys()) | {'message', 'asctime'}
+
+_listener = None
+_payload_logging = False
+
+
+def payload_logging_enabled():
+    """Whether full request/response payload dumps were requested via LOG_DEBUG_PAYLOADS"""
+    return _payload_logging
+
+
+def _truncate(value, limit):
+    if limit and isinstance(value, str) and len(value) > limit:
+        return f"{value[:limit]}... [{len(value) - limit} chars truncated]"
+    return value
+
+
+def _parse_sample_rates(spec):
+    """Parse ``event=rate,event=rate`` into a dict"""
+    rates = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        event, _, rate = item.partition('=')
+        try:
+            rates[event.strip()] = max(0.0, min(1.0, float(rate)))
+        except ValueError:
+            continue
+    return rates
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Drops a fraction of records tagged with ``extra={'event': ...}``.
+
+    Warnings and errors are never sampled out.
+    """
+
+    def __init__(self, rates, default_rate=1.0):
+        super().__init__()
+        self.rates = rates
+        self.default_rate = default_rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        event = getattr(record, 'event', None)
+        rate = self.rates.get(event, self.default_rate) if event else 1.0
+        return rate >= 1.0 or random.random() < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with ``extra`` fields included and long non-error strings truncated"""
+
+    def __init__(self, max_field_length=500):
+        super().__init__()
+        self.max_field_length = max_field_length
+
+    def format(self, record):
+        # Errors keep their full traceback
+        limit = 0 if record.levelno >= logging.ERROR else self.max_field_length
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': _truncate(record.getMessage(), limit),
+        }
+        for key, value in vars(record).items():
+            if key in _RESERVED_ATTRS or key.startswith('_'):
+                continue
+            entry[key] = _truncate(value if isinstance(value, (int, float, bool, type(None))) else str(value), limit)
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class TruncatingFormatter(logging.Formatter):
+    """Plain text formatter that caps the length of the message"""
+
+    def __init__(self, fmt, max_field_length=500):
+        super().__init__(fmt)
+        self.max_field_length = max_field_length
+
+    def formatMessage(self, record):
+        if record.levelno < logging.ERROR:
+            record.message = _truncate(record.message, self.max_field_length)
+        return super().formatMessage(record)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def configure_logging():
+    """
+    Route all logging through a bounded queue drained by a background thread.
+
+    Request threads only pay for the sampling decision and an enqueue; formatting
+    and I/O happen on the listener thread. Safe to call more than once.
+    """
+    global _listener, _payload_logging
+
+    if _listener is not None:
+        return
+
+    level = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper(), logging.INFO)
+    _payload_logging = os.getenv('LOG_DEBUG_PAYLOADS', 'false').lower() == 'true'
+    max_field_length = 0 if _payload_logging else int(os.getenv('LOG_MAX_FIELD_LENGTH', '500'))
+
+    if os.getenv('LOG_FORMAT', 'text').lower() == 'json':
+        formatter = JsonFormatter(max_field_length)
+    else:
+        formatter = TruncatingFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s', max_field_length)
+
+    handlers = [logging.StreamHandler()]
+    log_file = os.getenv('LOG_FILE')
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    queue_handler = DroppingQueueHandler(log_queue)
+    if not _payload_logging:
+        queue_handler.addFilter(SamplingFilter(
+            _parse_sample_rates(os.getenv('LOG_SAMPLE_RATES', '')),
+            default_rate=float(os.getenv('LOG_DEFAULT_SAMPLE_RATE', '1.0'))
+        ))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
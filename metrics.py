@@ -0,0 +1,192 @@
+import time
+import bisect
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label_value(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for labelvalues, value in items:
+            yield self.name + '_total', _format_labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    """Cumulative latency histogram, optionally split by labels"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, (list(s[0]), s[1], s[2])) for key, s in self._series.items())
+        for labelvalues, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(bound)))
+                yield self.name + '_bucket', labels, cumulative
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield self.name + '_sum', labels, total
+            yield self.name + '_count', labels, count
+
+
+class MetricsRegistry:
+    """
+    Collection of metrics rendered in the Prometheus text exposition format.
+
+    Values are per process; under gunicorn each worker exposes its own series,
+    so scrape every worker or aggregate with the ``instance`` label.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._gauge_callbacks = []
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def gauge_callback(self, prefix, documentation, callback):
+        """
+        Export the numeric values of ``callback()`` as gauges named ``<prefix>_<key>``.
+
+        Nested dicts are flattened with underscores; non-numeric values are skipped.
+        """
+        with self._lock:
+            self._gauge_callbacks.append((prefix, documentation, callback))
+
+    @staticmethod
+    def _flatten(prefix, values):
+        for key, value in values.items():
+            name = f"{prefix}_{key}"
+            if isinstance(value, dict):
+                yield from MetricsRegistry._flatten(name, value)
+            elif isinstance(value, bool):
+                yield name, int(value)
+            elif isinstance(value, (int, float)):
+                yield name, value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+            gauge_callbacks = list(self._gauge_callbacks)
+
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {_format_value(value)}")
+
+        for prefix, documentation, callback in gauge_callbacks:
+            try:
+                values = callback()
+            except Exception as e:
+                logger.warning(f"Failed to collect {prefix} metrics: {str(e)}")
+                continue
+            if not values:
+                continue
+            for name, value in self._flatten(prefix, values):
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {_format_value(value)}")
+
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUEST_LATENCY = REGISTRY.histogram(
+    'chatbot_request_duration_seconds', 'End-to-end HTTP request latency', ['endpoint', 'status'])
+STAGE_LATENCY = REGISTRY.histogram(
+    'chatbot_stage_duration_seconds', 'Latency of individual answer pipeline stages', ['stage'])
+ANSWERS = REGISTRY.counter(
+    'chatbot_answers', 'Answers served, by where the answer came from', ['source'])
+FALLBACKS = REGISTRY.counter(
+    'chatbot_fallbacks', 'Agent responses that fell back to a canned answer', ['reason'])
+API_ERRORS = REGISTRY.counter(
+    'chatbot_google_api_errors', 'GoogleAPICallError raised by Dialogflow calls', ['error'])
+RATE_LIMITED = REGISTRY.counter(
+    'chatbot_rate_limited', 'Requests rejected with HTTP 429', ['endpoint'])
+AGENT_RETRIES = REGISTRY.counter(
+    'chatbot_agent_retries', 'Agent calls retried after a retryable failure', ['error'])
+AGENT_HEDGES = REGISTRY.counter(
+    'chatbot_agent_hedges', 'Agent calls hedged to the secondary region, by which region answered', ['winner'])
@@ -0,0 +1,201 @@
+import os
+import time
+import random
+import threading
+import logging
+from concurrent.futures import FIRST_COMPLETED, wait
+
+from google.api_core.exceptions import (
+    Aborted, DeadlineExceeded, GoogleAPICallError, ServerError, ServiceUnavailable, TooManyRequests
+)
+
+logger = logging.getLogger(__name__)
+
+# Failures where the agent did not act on the request, so trying again cannot
+# advance the conversation twice
+RETRYABLE_ERRORS = (ServiceUnavailable, TooManyRequests, Aborted)
+
+# Failures that say something about the agent's health rather than the request
+UNHEALTHY_ERRORS = (ServerError, TooManyRequests)
+
+
+class Deadline:
+    """End-to-end time budget for answering one request"""
+
+    def __init__(self, budget):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def check(self, minimum=0.0):
+        """Seconds left, raising DeadlineExceeded when fewer than ``minimum`` remain"""
+        remaining = self.remaining()
+        if remaining <= minimum:
+            raise DeadlineExceeded(f"Request budget of {self.budget}s exhausted")
+        return remaining
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter for retryable agent failures"""
+
+    def __init__(self, max_attempts=3, base_delay=0.2, max_delay=2.0, min_timeout=0.5):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        # An attempt with less time than this left in the budget is not started
+        self.min_timeout = min_timeout
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_attempts=int(os.getenv('AGENT_MAX_ATTEMPTS', '3')),
+            base_delay=float(os.getenv('AGENT_RETRY_BASE_DELAY_SECONDS', '0.2')),
+            max_delay=float(os.getenv('AGENT_RETRY_MAX_DELAY_SECONDS', '2')),
+            min_timeout=float(os.getenv('AGENT_MIN_ATTEMPT_SECONDS', '0.5')),
+        )
+
+    @staticmethod
+    def is_retryable(error):
+        return isinstance(error, RETRYABLE_ERRORS)
+
+    def delay(self, attempt):
+        """Backoff before retry number ``attempt`` (1-based)"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+    def next_delay(self, error, attempt, deadline):
+        """Backoff before retrying ``error`` after ``attempt`` attempts, or None to give up"""
+        if not self.is_retryable(error) or attempt >= self.max_attempts:
+            return None
+        delay = self.delay(attempt)
+        if delay + self.min_timeout > deadline.remaining():
+            return None
+        return delay
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling the agent while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Stops calling the agent after ``failure_threshold`` consecutive failures.
+
+    While open, calls are refused for ``reset_timeout`` seconds. After that a
+    single probe call is let through (half-open): success closes the circuit,
+    failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+        self.opened = 0
+        self.rejected = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            failure_threshold=int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5')),
+            reset_timeout=float(os.getenv('CIRCUIT_RESET_SECONDS', '30')),
+        )
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self):
+        """Whether a call may go to the agent now"""
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.info("Agent circuit closed")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_error(self, error):
+        """Record a failed call; errors caused by the request itself show the agent is up"""
+        if isinstance(error, GoogleAPICallError) and not isinstance(error, UNHEALTHY_ERRORS):
+            self.record_success()
+        else:
+            self.record_failure()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self._failures >= self.failure_threshold):
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+                self.opened += 1
+                logger.warning(f"Agent circuit opened after {self._failures} consecutive failures")
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state(time.monotonic())
+            return {
+                'open': state == self.OPEN,
+                'half_open': state == self.HALF_OPEN,
+                'consecutive_failures': self._failures,
+                'opened': self.opened,
+                'rejected': self.rejected,
+            }
+
+
+def hedged_call(executor, primary, secondary, delay, timeout):
+    """
+    Run ``primary()`` and, if it has not succeeded after ``delay`` seconds,
+    also ``secondary()``; return whichever succeeds first.
+
+    Returns ``(result, hedged, hedge_won)``. When both fail the primary's
+    error is raised. Losing calls are left to finish in the background.
+    """
+    deadline = time.monotonic() + timeout
+    primary_future = executor.submit(primary)
+    done, _ = wait([primary_future], timeout=delay)
+    if primary_future in done and primary_future.exception() is None:
+        return primary_future.result(), False, False
+
+    secondary_future = executor.submit(secondary)
+    pending = {primary_future, secondary_future}
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                return future.result(), True, future is secondary_future
+
+    if primary_future.done() and primary_future.exception() is not None:
+        raise primary_future.exception()
+    if secondary_future.done() and secondary_future.exception() is not None:
+        raise secondary_future.exception()
+    raise DeadlineExceeded(f"No hedged agent call finished within {timeout}s")
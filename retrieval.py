@@ -0,0 +1,158 @@
+import os
+import time
+import threading
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+
+
+class LocalRetriever:
+    """
+    Answers MQA questions from a persisted Chroma collection of the agency documents.
+
+    Only queries whose best match clears ``score_threshold`` are answered locally;
+    everything else is left for the Dialogflow agent.
+    """
+
+    # An index built by a separate ingest.py run is picked up within this long
+    AVAILABILITY_RECHECK_SECONDS = 60
+
+    def __init__(self, persist_directory, collection_name="mqa_documents",
+                 embedding_model="sentence-transformers/all-MiniLM-L6-v2",
+                 score_threshold=0.75, top_k=3, degraded_threshold=0.5):
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.embedding_model = embedding_model
+        self.score_threshold = score_threshold
+        # Lower bar used only while the agent is unavailable
+        self.degraded_threshold = degraded_threshold
+        self.top_k = top_k
+        self._store = None
+        self._store_lock = threading.Lock()
+        # Whether the index exists is checked on disk at most every AVAILABILITY_RECHECK_SECONDS
+        # until it does, instead of scanning the directory on every query
+        self._available = False
+        self._available_checked_at = None
+
+    @classmethod
+    def from_env(cls):
+        """Build a retriever from environment variables, or None when disabled"""
+        persist_directory = os.getenv("VECTOR_STORE_DIR", "vector_store")
+        if os.getenv("LOCAL_RETRIEVAL_ENABLED", "true").lower() != "true":
+            return None
+        return cls(
+            persist_directory=persist_directory,
+            collection_name=os.getenv("VECTOR_STORE_COLLECTION", "mqa_documents"),
+            embedding_model=os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2"),
+            score_threshold=float(os.getenv("LOCAL_RETRIEVAL_THRESHOLD", "0.75")),
+            top_k=int(os.getenv("LOCAL_RETRIEVAL_TOP_K", "3")),
+            degraded_threshold=float(os.getenv("LOCAL_RETRIEVAL_DEGRADED_THRESHOLD", "0.5")),
+        )
+
+    @property
+    def store(self):
+        """Open the Chroma collection on first use"""
+        if self._store is None:
+            with self._store_lock:
+                if self._store is None:
+                    from langchain_chroma import Chroma
+                    from langchain_community.embeddings import HuggingFaceEmbeddings
+
+                    embeddings = HuggingFaceEmbeddings(
+                        model_name=self.embedding_model,
+                        encode_kwargs={'normalize_embeddings': True}
+                    )
+                    self._store = Chroma(
+                        collection_name=self.collection_name,
+                        embedding_function=embeddings,
+                        persist_directory=self.persist_directory,
+                        collection_metadata={'hnsw:space': 'cosine'}
+                    )
+        return self._store
+
+    def warm_up(self):
+        """Load the embedding model and open the index ahead of the first query"""
+        if not self.is_available():
+            return
+        try:
+            self.store
+            logger.info(f"Local retrieval index {self.collection_name} loaded")
+        except Exception as e:
+            logger.warning(f"Could not load local retrieval index: {str(e)}")
+
+    def _index_on_disk(self):
+        if not os.path.isdir(self.persist_directory):
+            return False
+        with os.scandir(self.persist_directory) as entries:
+            return any(entries)
+
+    def is_available(self):
+        """Whether a persisted index exists on disk"""
+        if self._available:
+            return True
+        now = time.monotonic()
+        if self._available_checked_at is None or now - self._available_checked_at >= self.AVAILABILITY_RECHECK_SECONDS:
+            self._available_checked_at = now
+            self._available = self._index_on_disk()
+        return self._available
+
+    def index_documents(self, documents_dir):
+        """Incrementally index every PDF/TXT file under ``documents_dir``, returning the chunks added"""
+        from ingest import DocumentIngester
+
+        chunks_added = DocumentIngester.from_env(self).run(documents_dir)['chunks_added']
+        self._available = self._index_on_disk()
+        return chunks_added
+
+    @staticmethod
+    def _source_for(document):
+        """Describe where a chunk came from for the ``sources`` list"""
+        source = document.metadata.get('source', '')
+        title = os.path.basename(source) or 'MQA document'
+        page = document.metadata.get('page')
+        if page is not None:
+            title = f"{title} (p. {int(page) + 1})"
+        return {'title': title, 'uri': source}
+
+    def answer(self, query, score_threshold=None):
+        """
+        Return ``{'answer', 'sources', 'score'}`` when the top hit is confident enough,
+        otherwise None
+        """
+        score_threshold = self.score_threshold if score_threshold is None else score_threshold
+        if not self.is_available():
+            return None
+
+        try:
+            results = self.store.similarity_search_with_relevance_scores(query, k=self.top_k)
+        except Exception as e:
+            logger.error(f"Local retrieval failed: {str(e)}")
+            return None
+
+        if not results:
+            return None
+
+        top_document, top_score = results[0]
+        if top_score < score_threshold:
+            logger.info(f"Local retrieval below threshold ({top_score:.3f})")
+            return None
+
+        sources = []
+        for document, score in results:
+            if score < score_threshold:
+                continue
+            source = self._source_for(document)
+            if source not in sources:
+                sources.append(source)
+
+        return {
+            'answer': top_document.page_content.strip(),
+            'sources': sources,
+            'score': top_score,
+        }
+
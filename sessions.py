@@ -0,0 +1,110 @@
+import os
+import hmac
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+class AgentSession:
+    """State tracked for one browser session's Dialogflow conversation"""
+
+    __slots__ = ('agent_session_id', 'created_at', 'last_used', 'turns')
+
+    def __init__(self, agent_session_id, now):
+        self.agent_session_id = agent_session_id
+        self.created_at = now
+        self.last_used = now
+        self.turns = 0
+
+
+class SessionRegistry:
+    """
+    Bounded map from Flask ``session_id`` to a Dialogflow CX session.
+
+    The Dialogflow session id is derived from the Flask session id and
+    ``secret``, so every worker process talks to the same agent session for a
+    browser session; the registry itself only keeps per-worker bookkeeping.
+    Sessions idle for longer than ``ttl`` seconds are dropped, matching the
+    agent's own session expiry, and the least recently used session is evicted
+    once ``max_sessions`` is reached. Entries are kept in last-used order so
+    expiry only ever inspects the oldest entries.
+    """
+
+    def __init__(self, secret, max_sessions=10000, ttl=1800):
+        self._secret = secret.encode('utf-8')
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.created = 0
+        self.expired = 0
+        self.evicted = 0
+
+    @classmethod
+    def from_env(cls):
+        """Build a registry from environment variables"""
+        return cls(
+            secret=os.getenv("AGENT_SESSION_SECRET") or os.getenv("FLASK_SECRET_KEY", "dev-secret-key-change-in-production"),
+            max_sessions=int(os.getenv("SESSION_REGISTRY_MAX_SESSIONS", "10000")),
+            ttl=float(os.getenv("SESSION_REGISTRY_TTL_SECONDS", "1800")),
+        )
+
+    def _purge_expired(self, now):
+        while self._sessions:
+            key, oldest = next(iter(self._sessions.items()))
+            if now - oldest.last_used < self.ttl:
+                break
+            del self._sessions[key]
+            self.expired += 1
+
+    def agent_session_id(self, session_id):
+        """Dialogflow session id for a Flask session, within the agent's 36 character limit"""
+        return hmac.new(self._secret, session_id.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+    def touch(self, session_id):
+        """Return the Dialogflow session id for a Flask session, recording the turn"""
+        now = time.monotonic()
+
+        with self._lock:
+            self._purge_expired(now)
+
+            state = self._sessions.get(session_id)
+            if state is None:
+                state = AgentSession(self.agent_session_id(session_id), now)
+                self._sessions[session_id] = state
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+            else:
+                self._sessions.move_to_end(session_id)
+
+            state.last_used = now
+            state.turns += 1
+            return state.agent_session_id
+
+    def get(self, session_id):
+        """Return the tracked state for a session, or None"""
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None or time.monotonic() - state.last_used >= self.ttl:
+                return None
+            return state
+
+    def end(self, session_id):
+        """Drop a session's bookkeeping; a new agent conversation needs a new Flask session id"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': len(self._sessions),
+                'max_sessions': self.max_sessions,
+                'created': self.created,
+                'expired': self.expired,
+                'evicted': self.evicted,
+            }
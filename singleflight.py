@@ -0,0 +1,127 @@
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+        self.waiters = 0
+
+
+class _StreamCall:
+    __slots__ = ('changed', 'events', 'finished', 'error')
+
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.events = []
+        self.finished = False
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait and receive the same result (or exception). Nothing is kept
+    once the call completes, so later callers trigger a fresh execution.
+    ``stream`` does the same for generators, replaying what the running
+    generator has yielded so far to a late caller and then following it.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._streams = {}
+        self._lock = threading.Lock()
+
+        self.issued = 0
+        self.coalesced = 0
+
+    def do(self, key, func, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` unless an identical call is already in flight"""
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self.issued += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def stream(self, key, func, *args, **kwargs):
+        """Yield the items of ``func(*args, **kwargs)``, sharing one running generator per key"""
+        with self._lock:
+            call = self._streams.get(key)
+            if call is not None:
+                self.coalesced += 1
+                leader = False
+            else:
+                call = self._streams[key] = _StreamCall()
+                self.issued += 1
+                leader = True
+
+        if not leader:
+            position = 0
+            while True:
+                with call.changed:
+                    while position == len(call.events) and not call.finished:
+                        call.changed.wait()
+                    pending = call.events[position:]
+                    position += len(pending)
+                    finished = call.finished
+                yield from pending
+                if finished:
+                    if call.error is not None:
+                        raise call.error
+                    return
+
+        try:
+            for item in func(*args, **kwargs):
+                with call.changed:
+                    call.events.append(item)
+                    call.changed.notify_all()
+                yield item
+        except GeneratorExit:
+            call.error = RuntimeError("Shared stream abandoned by its first caller")
+            raise
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._streams[key]
+            with call.changed:
+                call.finished = True
+                call.changed.notify_all()
+
+    def stats(self):
+        with self._lock:
+            total = self.issued + self.coalesced
+            return {
+                'in_flight': len(self._calls) + len(self._streams),
+                'issued': self.issued,
+                'coalesced': self.coalesced,
+                'coalesced_ratio': round(self.coalesced / total, 4) if total else 0.0,
+            }
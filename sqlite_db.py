@@ -0,0 +1,15 @@
+import sqlite3
+
+
+def sqlite_path(uri):
+    """``sqlite:///relative.db`` or ``sqlite:////absolute.db`` to a filesystem path"""
+    path = uri.split('://', 1)[1]
+    return path[1:] if path.startswith('/') else path
+
+
+def connect(path):
+    """Autocommit connection in WAL mode, shareable by the processes on one host"""
+    connection = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
@@ -15,6 +15,15 @@ class Chatbox {
         this.messages = [];
         this.selectedCategory = null;
         
+        // With a shared conversation store the history lives on the server and only
+        // recent turns are loaded on open; otherwise it is kept in localStorage
+        this.serverHistory = document.body.dataset.history === 'server';
+        this.historyPageSize = 20;
+        this.historyLoaded = false;
+        this.historyCursor = null;
+        // Client-side messages are recorded in order, ahead of later predictions
+        this.recordQueue = Promise.resolve();
+        
         // Category to image mapping
         this.categoryImages = {
             accreditation: 'accreditation.png',
@@ -35,99 +44,15 @@ class Chatbox {
             'apel-m': 'APEL.M - Micro-credentials'
         };
 
-        // Pre-determined answers for each category
-        this.predefinedAnswers = {
-            accreditation: {
-                "What is the accreditation process timeline?": "The accreditation process typically takes 6-9 months from application submission to final decision. This includes document review, site visits, and committee evaluation.",
-                "What documents are required for accreditation?": "Required documents include: institutional profile, program specifications, quality assurance documents, faculty qualifications, facility details, and financial sustainability reports.",
-                "How to check accreditation status?": "You can check accreditation status through the MQA portal at portal.mqa.gov.my or contact our accreditation division directly at accreditation@mqa.gov.my",
-                "What are the accreditation fees?": "Accreditation fees vary based on program level and institution type. Basic fees start from RM 5,000 for certificate programs to RM 15,000 for doctoral programs.",
-                "How to appeal an accreditation decision?": "Appeals must be submitted within 30 days of decision notification. Submit a formal appeal letter with supporting documents to appeals@mqa.gov.my"
-            },
-            framework: {
-                "What is the Malaysian Qualifications Framework?": "The MQF is a unified national qualifications framework that organizes qualifications according to a set of criteria based on learning outcomes.",
-                "How does the MQF work?": "The MQF functions as a reference point for qualifications, ensuring quality and facilitating credit transfer and recognition across education sectors.",
-                "What are the MQF levels?": "The MQF has 8 levels from Level 1 (Certificate) to Level 8 (Doctoral), with each level specifying learning outcomes and credit requirements.",
-                "Where can I find the latest MQA policies?": "Latest policies are available on the official MQA website at www.mqa.gov.my/policies or through the MQA digital library.",
-                "How often are framework standards updated?": "Framework standards are reviewed every 3-5 years to ensure relevance with industry needs and international best practices."
-            },
-            qualifications: {
-                "What are the standards for new programs?": "New programs must meet MQF level descriptors, have adequate resources, qualified faculty, and align with national education goals.",
-                "How to develop a new qualification?": "Follow the MQA program development guidelines, conduct needs analysis, design curriculum based on learning outcomes, and submit proposal through the online system.",
-                "What are the program standards requirements?": "Requirements include: clear learning outcomes, appropriate assessment methods, qualified teaching staff, adequate facilities, and quality assurance mechanisms.",
-                "How to modify an existing qualification?": "Submit modification proposal through MQA portal, providing justification and impact analysis. Major changes may require re-accreditation.",
-                "Where can I find the qualification standards handbook?": "The handbook is available for download at www.mqa.gov.my/standards-handbook"
-            },
-            recognition: {
-                "How to get a qualification recognized?": "Submit application through MQA recognition portal with complete academic transcripts, certificate copies, and program details.",
-                "What is the recognition process?": "Process includes document verification, qualification assessment against MQF, committee review, and issuance of recognition certificate.",
-                "Which qualifications need recognition?": "All foreign qualifications and local qualifications from non-accredited institutions require MQA recognition for official purposes.",
-                "How long does recognition take?": "Standard processing time is 2-3 months for complete applications. Complex cases may take longer.",
-                "What documents are needed for recognition?": "Required: academic transcripts, certificates, program specifications, institution details, and identification documents."
-            },
-            equivalency: {
-                "What is qualification equivalency?": "Equivalency establishes the comparable MQF level for qualifications obtained from different education systems.",
-                "How to apply for equivalency?": "Apply through MQA equivalency portal with complete academic documents and pay the assessment fee.",
-                "Which countries' qualifications are recognized?": "MQA recognizes qualifications from countries with established quality assurance systems and mutual recognition agreements.",
-                "What is the equivalency assessment process?": "Assessment compares learning outcomes, program duration, content, and assessment methods against MQF standards.",
-                "How long does equivalency assessment take?": "Standard assessment takes 4-6 weeks. Additional verification may extend this period."
-            },
-            apel: {
-                "What is APEL?": "APEL (Accreditation of Prior Experiential Learning) recognizes skills and knowledge gained through work and life experiences.",
-                "Who can apply for APEL?": "Malaysian citizens aged 21+ with relevant work experience can apply for APEL assessment for entry to programs or credit transfer.",
-                "How does APEL work?": "Candidates document their learning experiences, submit portfolio for assessment, and may undergo interviews or practical tests.",
-                "What are the APEL requirements?": "Minimum 3 years relevant experience, portfolio evidence, and meeting specific program entry requirements.",
-                "How to apply for APEL assessment?": "Register through APEL online system, prepare learning portfolio, and submit for assessment with required fees."
-            },
-            // APEL sub-categories
-            'apel-a': {
-                "What is APEL.A?": "APEL.A (Access) allows individuals with work experience to enter higher education programs without formal academic qualifications.",
-                "Who is eligible for APEL.A?": "Malaysian citizens aged 21+ with minimum 3 years relevant work experience in the field of study.",
-                "How to apply for APEL.A?": "Apply through the APEL online portal, submit portfolio of experiential learning, and attend assessment interview.",
-                "What documents are needed for APEL.A?": "Required: Identification documents, work experience evidence, portfolio, and application form.",
-                "What is the APEL.A assessment process?": "Assessment includes portfolio review, interview, and sometimes practical tests to verify learning outcomes."
-            },
-            'apel-c': {
-                "What is APEL.C?": "APEL.C (Credit Transfer) allows recognition of prior learning for credit exemption in academic programs.",
-                "How many credits can I get through APEL.C?": "Maximum 50% of total program credits can be obtained through APEL.C, subject to institutional policies.",
-                "What types of learning qualify for APEL.C?": "Work experience, professional training, online courses, and other verifiable learning experiences.",
-                "How to apply for APEL.C credit transfer?": "Submit application through participating institutions with evidence of prior learning.",
-                "What is the cost of APEL.C assessment?": "Assessment fees vary by institution, typically ranging from RM 200-500 per credit hour."
-            },
-            'apel-q': {
-                "What is APEL.Q?": "APEL.Q (Qualifications) provides formal recognition of experiential learning leading to full qualifications.",
-                "What qualifications are available through APEL.Q?": "Certificate, Diploma, and Advanced Diploma levels in various fields.",
-                "How long does APEL.Q assessment take?": "Complete assessment process typically takes 3-6 months depending on qualification level.",
-                "What are the APEL.Q requirements?": "Minimum 5 years relevant experience, comprehensive portfolio, and successful assessment.",
-                "Are APEL.Q qualifications recognized?": "Yes, APEL.Q qualifications are recognized under the Malaysian Qualifications Framework."
-            },
-            'apel-m': {
-                "What is APEL.M?": "APEL.M (Micro-credentials) recognizes specific skills and competencies through short, focused learning programs.",
-                "What types of micro-credentials are available?": "Digital skills, technical competencies, professional development, and industry-specific skills.",
-                "How long do APEL.M programs take?": "Typically 2-6 months depending on the complexity of skills being assessed.",
-                "Are APEL.M credentials stackable?": "Yes, multiple micro-credentials can be combined toward larger qualifications.",
-                "How to register for APEL.M?": "Register through approved training providers or the MQA APEL portal."
-            },
-            faq: {
-                "How to contact MQA directly?": "Call 03-7968 7002, email enquiry@mqa.gov.my, or visit MQA headquarters at Menara MQA, Cyberjaya.",
-                "Where is MQA headquarters located?": "MQA Headquarters: Malaysian Qualifications Agency, Menara MQA, Lingkaran Cyber Point Timur, 63000 Cyberjaya, Selangor.",
-                "What are MQA's operating hours?": "Monday-Friday: 8:00 AM - 5:00 PM. Closed on weekends and public holidays.",
-                "How to file a complaint?": "Submit complaints through MQA portal, email complaint@mqa.gov.my, or call the complaints hotline at 03-7968 7029.",
-                "Where can I download official forms?": "All official forms available at www.mqa.gov.my/forms or through the MQA digital services portal."
-            }
-        };
+        // Predefined questions and answers, fetched per category from /faq on first use
+        this.faqCache = {};
         
         this.init();
     }
 
     init() {
-        this.loadChatHistory();
+        this.loadChatState();
         this.initEventListeners();
-        
-        // Initialize the chat if it's active
-        if (this.state) {
-            this.renderStoredMessages();
-        }
     }
 
     initEventListeners() {
@@ -157,7 +82,30 @@ class Chatbox {
         }
     }
 
-    loadChatHistory() {
+    loadChatState() {
+        if (!this.serverHistory) {
+            this.loadLocalHistory();
+            return;
+        }
+        this.migrateLocalHistory();
+        
+        const savedState = localStorage.getItem('mqa_chat_state');
+        if (savedState) {
+            try {
+                this.selectedCategory = JSON.parse(savedState).selectedCategory || null;
+                
+                if (this.selectedCategory) {
+                    this.updateProfileImage(this.selectedCategory);
+                }
+            } catch (e) {
+                console.error('Error loading chat state:', e);
+                localStorage.removeItem('mqa_chat_state');
+            }
+        }
+    }
+
+    loadLocalHistory() {
+        this.historyLoaded = true;
         const savedChat = localStorage.getItem('mqa_chat_history');
         if (savedChat) {
             try {
@@ -175,19 +123,152 @@ class Chatbox {
         }
     }
 
-    saveChatHistory() {
-        const chatData = {
-            messages: this.messages,
-            selectedCategory: this.selectedCategory,
-            timestamp: new Date().toISOString()
+    migrateLocalHistory() {
+        // A history kept in localStorage before the server store was enabled is
+        // posted one message at a time and removed only once the server has it,
+        // so an interrupted migration resumes on the next visit
+        const savedChat = localStorage.getItem('mqa_chat_history');
+        if (!savedChat) return;
+        
+        let chatData;
+        try {
+            chatData = JSON.parse(savedChat);
+        } catch (e) {
+            localStorage.removeItem('mqa_chat_history');
+            return;
+        }
+        const pending = (chatData.messages || []).filter(msg => msg && msg.text && (msg.type === 'visitor' || msg.type === 'operator'));
+        if (!localStorage.getItem('mqa_chat_state') && chatData.selectedCategory) {
+            localStorage.setItem('mqa_chat_state', JSON.stringify({ selectedCategory: chatData.selectedCategory }));
+        }
+        
+        const migrateNext = () => {
+            if (pending.length === 0) {
+                localStorage.removeItem('mqa_chat_history');
+                return;
+            }
+            return this.postMessage(pending[0].text, pending[0].type)
+            .then(response => {
+                // Try again on a later visit while the server is busy; messages it refuses are dropped
+                if (response.status === 429 || response.status >= 500) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
+                }
+                pending.shift();
+                localStorage.setItem('mqa_chat_history', JSON.stringify({ ...chatData, messages: pending }));
+                return migrateNext();
+            });
         };
-        localStorage.setItem('mqa_chat_history', JSON.stringify(chatData));
+        this.recordQueue = this.recordQueue
+        .then(migrateNext)
+        .catch(error => console.error('Error migrating chat history:', error));
+    }
+
+    saveChatState() {
+        if (!this.serverHistory) {
+            localStorage.setItem('mqa_chat_history', JSON.stringify({
+                messages: this.messages,
+                selectedCategory: this.selectedCategory,
+                timestamp: new Date().toISOString()
+            }));
+            return;
+        }
+        localStorage.setItem('mqa_chat_state', JSON.stringify({ selectedCategory: this.selectedCategory }));
     }
 
     clearChatHistory() {
         localStorage.removeItem('mqa_chat_history');
+        localStorage.removeItem('mqa_chat_state');
         this.messages = [];
         this.selectedCategory = null;
+        this.historyCursor = null;
+    }
+
+    loadHistoryPage(before = null, limit = this.historyPageSize) {
+        const params = new URLSearchParams({ limit });
+        if (before) {
+            params.set('before', before);
+        }
+        return fetch(`/conversation?${params}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        });
+    }
+
+    turnToMessage(turn) {
+        return {
+            text: turn.role === 'operator' ? this.withSources(turn.text, turn.sources) : turn.text,
+            type: turn.role,
+            timestamp: turn.timestamp
+        };
+    }
+
+    loadRecentHistory() {
+        this.historyLoaded = true;
+        // Wait for a pending migration so the migrated messages are in the first page
+        this.recordQueue
+        .then(() => this.loadHistoryPage())
+        .then(page => {
+            this.messages = page.turns.map(turn => this.turnToMessage(turn));
+            this.historyCursor = page.next_before;
+        })
+        .catch(error => console.error('Error loading chat history:', error))
+        .then(() => this.renderStoredMessages());
+    }
+
+    renderEarlierButton() {
+        if (!this.historyCursor) return;
+        
+        const button = document.createElement('button');
+        button.classList.add('history__more');
+        button.textContent = 'Show earlier messages';
+        button.addEventListener('click', () => this.loadEarlierMessages(button));
+        this.args.messagesContainer.prepend(button);
+    }
+
+    loadEarlierMessages(button) {
+        const { messagesContainer } = this.args;
+        button.disabled = true;
+        
+        this.loadHistoryPage(this.historyCursor)
+        .then(page => {
+            const earlier = page.turns.map(turn => this.turnToMessage(turn));
+            this.messages = earlier.concat(this.messages);
+            this.historyCursor = page.next_before;
+            
+            // Insert above the loaded messages without moving what is on screen
+            const previousHeight = messagesContainer.scrollHeight;
+            const fragment = document.createDocumentFragment();
+            earlier.forEach(msg => fragment.appendChild(this.createMessageElement(msg.text, msg.type, msg.timestamp)));
+            button.remove();
+            messagesContainer.prepend(fragment);
+            this.renderEarlierButton();
+            messagesContainer.scrollTop += messagesContainer.scrollHeight - previousHeight;
+        })
+        .catch(error => {
+            console.error('Error loading earlier messages:', error);
+            button.disabled = false;
+        });
+    }
+
+    postMessage(text, type) {
+        return fetch('/conversation', {
+            method: 'POST',
+            body: JSON.stringify({ role: type, text }),
+            headers: {
+                'Content-Type': 'application/json'
+            },
+        });
+    }
+
+    recordMessage(text, type) {
+        if (!this.serverHistory) return;
+        
+        this.recordQueue = this.recordQueue
+        .then(() => this.postMessage(text, type))
+        .catch(error => console.error('Error saving chat message:', error));
     }
 
     renderStoredMessages() {
@@ -203,6 +284,7 @@ class Chatbox {
         this.messages.forEach(msg => {
             this.renderMessage(msg.text, msg.type, msg.timestamp, false);
         });
+        this.renderEarlierButton();
         
         if (!this.selectedCategory && this.state) {
             setTimeout(() => this.showMainCategories(), 100);
@@ -217,11 +299,10 @@ class Chatbox {
 
         if (this.state) {
             chatBox.classList.add('chatbox--active');
-            if (this.messages.length === 0) {
-                this.showWelcomeMessage();
-                setTimeout(() => this.showMainCategories(), 100);
-            } else {
+            if (this.historyLoaded) {
                 this.renderStoredMessages();
+            } else {
+                this.loadRecentHistory();
             }
         } else {
             chatBox.classList.remove('chatbox--active');
@@ -313,168 +394,77 @@ class Chatbox {
     }
 
     showSubCategoryQuestions(subCategory) {
-        const questions = {
-            'apel-a': [
-                "What is APEL.A?",
-                "Who is eligible for APEL.A?",
-                "How to apply for APEL.A?",
-                "What documents are needed for APEL.A?",
-                "What is the APEL.A assessment process?"
-            ],
-            'apel-c': [
-                "What is APEL.C?",
-                "How many credits can I get through APEL.C?",
-                "What types of learning qualify for APEL.C?",
-                "How to apply for APEL.C credit transfer?",
-                "What is the cost of APEL.C assessment?"
-            ],
-            'apel-q': [
-                "What is APEL.Q?",
-                "What qualifications are available through APEL.Q?",
-                "How long does APEL.Q assessment take?",
-                "What are the APEL.Q requirements?",
-                "Are APEL.Q qualifications recognized?"
-            ],
-            'apel-m': [
-                "What is APEL.M?",
-                "What types of micro-credentials are available?",
-                "How long do APEL.M programs take?",
-                "Are APEL.M credentials stackable?",
-                "How to register for APEL.M?"
-            ]
-        };
+        this.showQuestionsFor(subCategory, this.apelSubCategories[subCategory]);
+    }
 
-        const existingQuestions = this.args.messagesContainer.querySelector('.popular-questions');
-        if (existingQuestions) {
-            existingQuestions.remove();
-        }
+    showCategoryQuestions() {
+        this.showQuestionsFor(this.selectedCategory, this.getCategoryName(this.selectedCategory));
+    }
 
-        const categoryQuestions = questions[subCategory] || [];
-        const questionsHTML = `
-            <div class="popular-questions">
-                <p class="questions-header">Common questions about ${this.apelSubCategories[subCategory]}:</p>
-                <div class="question-tabs">
-                    ${categoryQuestions.map(q => 
-                        `<button class="question-tab">${q}</button>`
-                    ).join('')}
-                    <button class="question-tab custom-question-tab">Ask a custom question</button>
-                </div>
-            </div>
-        `;
-        
-        const container = document.createElement('div');
-        container.innerHTML = questionsHTML;
-        this.args.messagesContainer.appendChild(container);
+    loadCategory(category) {
+        if (this.faqCache[category]) {
+            return Promise.resolve(this.faqCache[category]);
+        }
         
-        container.querySelectorAll('.question-tab').forEach(tab => {
-            tab.addEventListener('click', () => {
-                const question = tab.textContent;
-                container.remove();
-                
-                if (question === "Ask a custom question") {
-                    this.addMessage("Ask a custom question", 'visitor');
-                    this.showCustomQuestionPrompt();
-                } else {
-                    this.addMessage(question, 'visitor');
-                    this.showPredefinedAnswer(question);
-                }
-            });
+        return fetch(`/faq/${encodeURIComponent(category)}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(details => {
+            this.faqCache[category] = details;
+            return details;
         });
-        
-        this.scrollToBottom();
     }
 
-    showCategoryQuestions() {
-        const questions = {
-            accreditation: [
-                "What is the accreditation process timeline?",
-                "What documents are required for accreditation?",
-                "How to check accreditation status?",
-                "What are the accreditation fees?",
-                "How to appeal an accreditation decision?"
-            ],
-            framework: [
-                "What is the Malaysian Qualifications Framework (MQF)?",
-                "How does the MQF work?",
-                "What are the MQF levels?",
-                "Where can I find the latest MQA policies?",
-                "How often are framework standards updated?"
-            ],
-            qualifications: [
-                "What are the standards for new programs?",
-                "How to develop a new qualification?",
-                "What are the program standards requirements?",
-                "How to modify an existing qualification?",
-                "Where can I find the qualification standards handbook?"
-            ],
-            recognition: [
-                "How to get a qualification recognized?",
-                "What is the recognition process?",
-                "Which qualifications need recognition?",
-                "How long does recognition take?",
-                "What documents are needed for recognition?"
-            ],
-            equivalency: [
-                "What is qualification equivalency?",
-                "How to apply for equivalency?",
-                "Which countries' qualifications are recognized?",
-                "What is the equivalency assessment process?",
-                "How long does equivalency assessment take?"
-            ],
-            apel: [
-                "What is APEL?",
-                "Who can apply for APEL?",
-                "How does APEL work?",
-                "What are the APEL requirements?",
-                "How to apply for APEL assessment?"
-            ],
-            faq: [
-                "How to contact MQA directly?",
-                "Where is MQA headquarters located?",
-                "What are MQA's operating hours?",
-                "How to file a complaint?",
-                "Where can I download official forms?"
-            ]
-        };
-
+    showQuestionsFor(category, title) {
         const existingQuestions = this.args.messagesContainer.querySelector('.popular-questions');
         if (existingQuestions) {
             existingQuestions.remove();
         }
 
-        const categoryQuestions = questions[this.selectedCategory] || [];
-        const questionsHTML = `
-            <div class="popular-questions">
-                <p class="questions-header">Common questions about ${this.getCategoryName(this.selectedCategory)}:</p>
-                <div class="question-tabs">
-                    ${categoryQuestions.map(q => 
-                        `<button class="question-tab">${q}</button>`
-                    ).join('')}
-                    <button class="question-tab custom-question-tab">Ask a custom question</button>
+        this.loadCategory(category)
+        .catch(error => {
+            console.error('Error loading category questions:', error);
+            return { questions: [] };
+        })
+        .then(details => {
+            const categoryQuestions = details.questions.map(item => item.question);
+            const questionsHTML = `
+                <div class="popular-questions">
+                    <p class="questions-header">Common questions about ${title}:</p>
+                    <div class="question-tabs">
+                        ${categoryQuestions.map(q => 
+                            `<button class="question-tab">${this._escapeHtml(q)}</button>`
+                        ).join('')}
+                        <button class="question-tab custom-question-tab">Ask a custom question</button>
+                    </div>
                 </div>
-            </div>
-        `;
-        
-        const container = document.createElement('div');
-        container.innerHTML = questionsHTML;
-        this.args.messagesContainer.appendChild(container);
-        
-        container.querySelectorAll('.question-tab').forEach(tab => {
-            tab.addEventListener('click', () => {
-                const question = tab.textContent;
-                container.remove();
-                
-                if (question === "Ask a custom question") {
-                    this.addMessage("Ask a custom question", 'visitor');
-                    this.showCustomQuestionPrompt();
-                } else {
-                    this.addMessage(question, 'visitor');
-                    this.showPredefinedAnswer(question);
-                }
+            `;
+            
+            const container = document.createElement('div');
+            container.innerHTML = questionsHTML;
+            this.args.messagesContainer.appendChild(container);
+            
+            container.querySelectorAll('.question-tab').forEach(tab => {
+                tab.addEventListener('click', () => {
+                    const question = tab.textContent;
+                    container.remove();
+                    
+                    if (question === "Ask a custom question") {
+                        this.addMessage("Ask a custom question", 'visitor');
+                        this.showCustomQuestionPrompt();
+                    } else {
+                        this.addMessage(question, 'visitor');
+                        this.showPredefinedAnswer(question);
+                    }
+                });
             });
+            
+            this.scrollToBottom();
         });
-        
-        this.scrollToBottom();
     }
 
     showCustomQuestionPrompt() {
@@ -499,7 +489,9 @@ class Chatbox {
         setTimeout(() => {
             this.removeTypingIndicator();
             
-            const answer = this.predefinedAnswers[this.selectedCategory]?.[question];
+            const details = this.faqCache[this.selectedCategory];
+            const item = details && details.questions.find(entry => entry.question === question);
+            const answer = item && item.answer;
             if (answer) {
                 this.addMessage(answer, 'operator');
                 setTimeout(() => this.showFollowUpOptions(), 500);
@@ -604,7 +596,8 @@ class Chatbox {
         
         if (text === '') return;
 
-        this.addMessage(text, 'visitor');
+        // Questions sent for prediction are recorded by the server with their answer
+        this.addMessage(text, 'visitor', !this.selectedCategory);
         inputField.value = '';
         
         if (!this.selectedCategory) {
@@ -616,49 +609,184 @@ class Chatbox {
         // Handle custom user input - send to Vertex AI
         this.showTypingIndicator();
         
-        fetch('/predict', {
-            method: 'POST',
-            body: JSON.stringify({ 
-                message: text
-            }),
-            headers: {
-                'Content-Type': 'application/json'
-            },
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! status: ${response.status}`);
+        this.recordQueue
+        .then(() => this.streamPrediction(text))
+        .catch(error => {
+            // Fall back to the plain endpoint only when streaming is not served at all;
+            // rate limits, full stream slots and dropped streams are reported instead
+            if (!error.streamUnavailable) {
+                throw error;
             }
-            return response.json();
+            console.warn('Streaming unavailable, falling back to /predict:', error);
+            return this.fetchPrediction(text);
         })
         .then(data => {
+            this.removeStreamingMessage();
             this.removeTypingIndicator();
             
             if (data.error) {
-                this.addMessage(`Error: ${data.error}`, 'operator');
+                this.addMessage(`Error: ${data.error}`, 'operator', false);
             } else if (data.answer) {
-                this.addMessage(data.answer, 'operator');
+                this.addMessage(this.withSources(data.answer, data.sources), 'operator', false);
                 setTimeout(() => this.showFollowUpOptions(), 500);
             } else {
-                this.addMessage('No response received from server.', 'operator');
+                this.addMessage('No response received from server.', 'operator', false);
             }
         })
         .catch(error => {
+            this.removeStreamingMessage();
             this.removeTypingIndicator();
-            this.addMessage('Sorry, I encountered an error. Please try again or contact MQA directly.', 'operator');
+            this.addMessage('Sorry, I encountered an error. Please try again or contact MQA directly.', 'operator', false);
             console.error('API Error:', error);
         });
     }
 
-    addMessage(text, type) {
+    fetchPrediction(text) {
+        return fetch('/predict', {
+            method: 'POST',
+            body: JSON.stringify({ 
+                message: text
+            }),
+            headers: {
+                'Content-Type': 'application/json'
+            },
+        })
+        .then(response => {
+            if (!response.ok) {
+                return this.errorFromResponse(response);
+            }
+            return response.json();
+        });
+    }
+
+    errorFromResponse(response) {
+        // Error responses carry a message for the visitor in `answer`
+        return response.json()
+        .catch(() => ({}))
+        .then(data => ({ error: data.answer || data.error || `HTTP error! status: ${response.status}` }));
+    }
+
+    streamPrediction(text) {
+        return fetch('/predict/stream', {
+            method: 'POST',
+            body: JSON.stringify({ 
+                message: text
+            }),
+            headers: {
+                'Content-Type': 'application/json',
+                'Accept': 'text/event-stream'
+            },
+        })
+        .then(response => {
+            if (response.status === 404 || response.status === 405 || (response.ok && !response.body)) {
+                const error = new Error(`Streaming not supported (status ${response.status})`);
+                error.streamUnavailable = true;
+                throw error;
+            }
+            if (!response.ok) {
+                return this.errorFromResponse(response);
+            }
+            
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let result = null;
+            
+            const handleEvent = (rawEvent) => {
+                const data = rawEvent
+                    .split('\n')
+                    .filter(line => line.startsWith('data:'))
+                    .map(line => line.slice(5).trim())
+                    .join('\n');
+                if (!data) return;
+                
+                const event = JSON.parse(data);
+                if (event.type === 'chunk') {
+                    this.updateStreamingMessage(event.text);
+                } else if (event.type === 'final') {
+                    result = event;
+                } else if (event.type === 'error') {
+                    result = { error: event.error };
+                }
+            };
+            
+            const pump = () => reader.read().then(({ done, value }) => {
+                if (value) {
+                    buffer += decoder.decode(value, { stream: true });
+                    const events = buffer.split('\n\n');
+                    buffer = events.pop();
+                    events.forEach(handleEvent);
+                }
+                if (done) {
+                    if (buffer) handleEvent(buffer);
+                    if (!result) {
+                        throw new Error('Stream ended without an answer');
+                    }
+                    return result;
+                }
+                return pump();
+            });
+            
+            return pump();
+        });
+    }
+
+    updateStreamingMessage(text) {
+        const { messagesContainer } = this.args;
+        let messageElement = document.getElementById('streaming-message');
+        
+        if (!messageElement) {
+            this.removeTypingIndicator();
+            messageElement = document.createElement('div');
+            messageElement.id = 'streaming-message';
+            messageElement.classList.add('messages__item', 'messages__item--operator');
+            messageElement.innerHTML = '<div class="message__text"></div>';
+            messagesContainer.appendChild(messageElement);
+        }
+        
+        // Partial text is rendered as plain text; the final answer replaces it
+        messageElement.querySelector('.message__text').textContent = text;
+        this.scrollToBottom();
+    }
+
+    removeStreamingMessage() {
+        const messageElement = document.getElementById('streaming-message');
+        if (messageElement) {
+            messageElement.remove();
+        }
+    }
+
+    withSources(answer, sources) {
+        // Cited documents and links from the agent, shown under the answer
+        const links = (sources || [])
+            .filter(source => source.uri && /^https?:\/\//.test(source.uri))
+            .map(source => `<a href="${this._escapeHtml(source.uri).replace(/"/g, '%22')}" target="_blank" rel="noopener noreferrer">${this._escapeHtml(source.title || source.uri)}</a>`);
+        if (links.length === 0) {
+            return answer;
+        }
+        return `${answer}<div class="message__sources">Sources: ${links.join(', ')}</div>`;
+    }
+
+    addMessage(text, type, record = true) {
         const timestamp = new Date().toISOString();
         this.messages.push({ text, type, timestamp });
-        this.saveChatHistory();
+        this.saveChatState();
+        if (record) {
+            this.recordMessage(text, type);
+        }
         this.renderMessage(text, type, timestamp, true);
     }
 
     renderMessage(text, type, timestamp, scroll = true) {
         const { messagesContainer } = this.args;
+        messagesContainer.appendChild(this.createMessageElement(text, type, timestamp));
+        
+        if (scroll) {
+            this.scrollToBottom();
+        }
+    }
+
+    createMessageElement(text, type, timestamp) {
         const messageElement = document.createElement('div');
         messageElement.classList.add('messages__item', `messages__item--${type}`);
         
@@ -671,16 +799,16 @@ class Chatbox {
             <div class="message__time">${time}</div>
         `;
         
-        messagesContainer.appendChild(messageElement);
-        
-        if (scroll) {
-            this.scrollToBottom();
-        }
+        return messageElement;
     }
 
     resetChat() {
         if (confirm("Are you sure you want to reset the chat? All conversation history will be lost.")) {
             this.clearChatHistory();
+            // Queued so messages recorded before the reset cannot land after it
+            this.recordQueue = this.recordQueue
+                .then(() => fetch('/session/reset', { method: 'POST' }))
+                .catch(error => console.error('Session reset error:', error));
             this.args.messagesContainer.innerHTML = '';
             this.updateProfileImage(null);
             this.showWelcomeMessage();
@@ -688,13 +816,37 @@ class Chatbox {
         }
     }
 
+    loadFullHistory() {
+        // Pages older than the loaded turns are fetched for the download only
+        const older = [];
+        const fetchOlder = (before) => {
+            if (!before) {
+                return Promise.resolve(older.concat(this.messages));
+            }
+            return this.loadHistoryPage(before, 100).then(page => {
+                older.unshift(...page.turns.map(turn => this.turnToMessage(turn)));
+                return fetchOlder(page.next_before);
+            });
+        };
+        return fetchOlder(this.historyCursor);
+    }
+
     downloadChat() {
-        if (this.messages.length === 0) {
+        this.loadFullHistory()
+        .catch(error => {
+            console.error('Error loading chat history:', error);
+            return this.messages;
+        })
+        .then(messages => this.saveChatFile(messages));
+    }
+
+    saveChatFile(messages) {
+        if (messages.length === 0) {
             alert("No chat history to download.");
             return;
         }
 
-        const chatContent = this.formatChatForDownload();
+        const chatContent = this.formatChatForDownload(messages);
         const blob = new Blob([chatContent], { type: 'text/plain' });
         const url = URL.createObjectURL(blob);
         const a = document.createElement('a');
@@ -712,14 +864,14 @@ class Chatbox {
         }, 100);
     }
 
-    formatChatForDownload() {
+    formatChatForDownload(messages) {
         let content = "MQA Chat Conversation Log\n";
         content += "==========================\n\n";
         content += `Generated: ${new Date().toLocaleString()}\n`;
         content += `Category: ${this.selectedCategory ? this.getCategoryName(this.selectedCategory) : 'Not selected'}\n`;
         content += "==========================\n\n";
         
-        this.messages.forEach(msg => {
+        messages.forEach(msg => {
             const date = new Date(msg.timestamp);
             const time = date.toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
             const sender = msg.type === 'operator' ? 'MQA Bot' : 'You';